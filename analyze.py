@@ -0,0 +1,121 @@
+'''
+Batch analysis of positions by the engine of app.py, as JSON lines
+
+    python analyze.py positions.txt --workers 8 --time 1.0 > analysis.jsonl
+    echo "h8 i9 h9" | python analyze.py
+
+Each input line is a position in compact notation, the moves from black
+"h8 i9 h9" (see app.parse_moves), the side to move following from the
+number of moves. Blank lines and lines starting with # are skipped. The
+positions are analysed on a process pool, each with its own time limit,
+and one JSON object per position is written in the order of the input:
+the move chosen, its score and depth (null when no minmax search chose
+it), the rule that chose it, the search counters and the best threats of
+find_threats, or the error of the position. Only a bounded number of
+positions is read ahead, so inputs of any length can be streamed.
+'''
+import argparse
+import collections
+import concurrent.futures
+import json
+import os
+import sys
+
+import app
+
+
+# Threats of the side to move written per position
+THREATS = 5
+
+
+def analyze(moves, size, time_limit, node_limit):
+    '''
+    Analysis of the position after moves, as a JSON-ready dict
+    '''
+    board = app.position_board(moves, size)
+    color = "noir" if len(moves) % 2 == 0 else "blanc"
+    trace = app.SearchTrace()
+    app.choose_move(board, color, app.TranspositionTable(),
+                    time_limit=time_limit, node_limit=node_limit, trace=trace)
+    entry = trace.moves[-1]
+    # Only the minmax search gives a score and a depth
+    entry.setdefault("score", None)
+    entry.setdefault("depth", None)
+    entry["move"] = app.move_notation(*entry["move"])
+    entry["threats"] = [[app.move_notation(i, j), score]
+                        for i, j, score in app.find_threats(board, color)[:THREATS]]
+    return entry
+
+
+def read_positions(lines):
+    '''
+    (line number, text, moves or the parse error) of each position of lines
+    '''
+    for number, line in enumerate(lines, 1):
+        text = line.strip()
+        if not text or text.startswith("#"):
+            continue
+        try:
+            yield number, text, app.parse_moves(text)
+        except ValueError as error:
+            yield number, text, error
+
+
+def run(positions, workers, read_ahead, size, time_limit, node_limit):
+    '''
+    Results of the positions, in order, with at most read_ahead positions
+    submitted and not yet written
+    '''
+    pending = collections.deque()
+    with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+        for number, text, moves in positions:
+            if len(pending) >= read_ahead:
+                yield result(*pending.popleft())
+            future = moves if isinstance(moves, ValueError) else \
+                executor.submit(analyze, moves, size, time_limit, node_limit)
+            pending.append((number, text, future))
+        while pending:
+            yield result(*pending.popleft())
+
+
+def result(number, text, future):
+    '''
+    Output line of a position, from its analysis or the error that stopped
+    it, so that one position cannot stop the stream
+    '''
+    entry = {"line": number, "position": text}
+    try:
+        if isinstance(future, ValueError):
+            raise future
+        entry.update(future.result())
+    except Exception as error:
+        entry["error"] = "{}: {}".format(type(error).__name__, error)
+    return entry
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("input", nargs="?", default="-",
+                        help="file of positions, - for the standard input")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--time", type=float, default=app.MOVE_TIME_LIMIT,
+                        help="seconds of analysis per position")
+    parser.add_argument("--nodes", type=int, default=None,
+                        help="positions searched per position, instead of the time")
+    # The notation has no negative coordinates, so the board is bounded
+    parser.add_argument("--size", type=int, default=15, choices=range(5, 256), metavar="5..255")
+    parser.add_argument("--read-ahead", type=int, default=None,
+                        help="positions analysed ahead of the output, 4 per worker by default")
+    args = parser.parse_args()
+
+    time_limit = None if args.nodes is not None else args.time
+    read_ahead = args.read_ahead or 4 * args.workers
+    lines = sys.stdin if args.input == "-" else open(args.input)
+    with lines:
+        for entry in run(read_positions(lines), args.workers, read_ahead,
+                         args.size, time_limit, args.nodes):
+            print(json.dumps(entry), flush=True)
+
+
+if __name__ == "__main__":
+    main()
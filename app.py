@@ -1,10 +1,18 @@
 # %%
+import collections
+import concurrent.futures
 import enum
+import json
+import logging
 import math
-from copy import deepcopy
+import mmap
+import multiprocessing
+import os
 import random
-import matplotlib.pyplot as plt
-import numpy as np
+import re
+import struct
+import threading
+import time
 
 
 class bcolors:
@@ -19,7 +27,621 @@ class bcolors:
     UNDERLINE = '\033[4m'
 
 
+# Code of each colour in the board storage
+COLOR_CODES = {"vide": 0, "noir": 1, "blanc": 2}
+COLORS = ("vide", "noir", "blanc")
+
+# Horizontal, vertical, diagonal and anti-diagonal steps
+DIRECTIONS = ((0, 1), (1, 0), (1, 1), (-1, 1))
+
+
+def opponent(color):
+    return "noir" if color == "blanc" else "blanc"
+
+
+# Seconds of search for each of our moves
+MOVE_TIME_LIMIT = 5.0
+# Moves the time left for a game is shared between, at least
+MIN_MOVES_LEFT = 10
+# Deepest iteration of iterative_deepening
+MAX_DEPTH = 12
+# Score of a position won by five in a row, above any evaluate score
+WIN_SCORE = 100
+# Processes searching the root candidates, 1 to search in this process
+SEARCH_WORKERS = os.cpu_count() or 1
+# The search plays only on empty squares this close to a stone
+FRONTIER_DISTANCE = 2
+# Largest board kept as bitboards, bigger ones only store their stones
+DENSE_BOARD_LIMIT = 32
+# Board of __main__, 0 for an unbounded board
+BOARD_SIZE = int(os.environ.get("GOMOKU_SIZE", 15)) or None
+# Budget of the threat-space search run before minmax: number of our
+# forcing moves in a row and number of positions visited
+THREAT_SEARCH_DEPTH = 8
+THREAT_SEARCH_NODES = 1000
+# Search on the opponent's time in __main__, over its most likely replies
+PONDER = os.environ.get("GOMOKU_PONDER") == "1"
+PONDER_MOVES = 3
+# Search of __main__ after the forced moves: "minmax" or "mcts"
+ENGINE = os.environ.get("GOMOKU_ENGINE", "minmax")
+# UCT exploration constant and moves of a Monte Carlo playout before it is
+# counted as a draw
+MCTS_EXPLORATION = 1.4
+MCTS_ROLLOUT_DEPTH = 40
+# Opening book file, used for the first plies of the game
+BOOK_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "opening_book.bin")
+BOOK_PLIES = 8
+# Archive where __main__ and gomocup.py append every game, none when empty
+GAMES_PATH = os.environ.get(
+    "GOMOKU_GAMES", os.path.join(os.path.dirname(os.path.abspath(__file__)), "games.gmk"))
+# File receiving the JSON trace of each move of __main__, no trace when unset
+TRACE_PATH = os.environ.get("GOMOKU_TRACE")
+
+# Board display of __main__: "matplotlib", "terminal" or "none"
+RENDERER = os.environ.get("GOMOKU_RENDERER", "matplotlib")
+
+logger = logging.getLogger("gomoku")
+
+# Fixed seed so that hash keys are the same from one run to the other
+ZOBRIST_SEED = 15
+_zobrist_keys = {}
+
+
+def zobrist_keys(size):
+    '''
+    Random 64 bits keys of a board size, one per (colour code, cell)
+    '''
+    if size not in _zobrist_keys:
+        rng = random.Random(ZOBRIST_SEED * 1000 + size)
+        cells = size * (size + 1)
+        _zobrist_keys[size] = [[rng.getrandbits(64) for _ in range(cells)]
+                               for _ in range(3)]
+    return _zobrist_keys[size]
+
+
+_neighbour_indexes = {}
+
+
+def neighbour_indexes(size, distance=FRONTIER_DISTANCE):
+    '''
+    For each cell index of a board size, the indexes of the other cells at
+    most distance rows and columns away
+    '''
+    if (size, distance) not in _neighbour_indexes:
+        width = size + 1
+        neighbours = [()] * (size * width)
+        for i in range(size):
+            for j in range(size):
+                neighbours[i * width + j] = tuple(
+                    x * width + y
+                    for x in range(max(i - distance, 0), min(i + distance + 1, size))
+                    for y in range(max(j - distance, 0), min(j + distance + 1, size))
+                    if (x, y) != (i, j))
+        _neighbour_indexes[(size, distance)] = neighbours
+    return _neighbour_indexes[(size, distance)]
+
+
+# Extra keys mixed in the search keys
+_keys_rng = random.Random(ZOBRIST_SEED)
+ZOBRIST_MAXIMIZING = _keys_rng.getrandbits(64)
+ZOBRIST_COLOR = {"noir": _keys_rng.getrandbits(64),
+                 "blanc": _keys_rng.getrandbits(64)}
+
+
+class Board:
+    '''
+    Gomoku board stored as one bitboard per colour plus one byte per cell
+    Cell (i, j) is bit i * (size + 1) + j: the extra column always stays
+    empty so that shifting a bitboard along a direction never wraps a line
+    onto the next row
+    '''
+
+    def __init__(self, size=15):
+        self.size = size
+        self.width = size + 1
+        # 0 vide, 1 noir, 2 blanc
+        self.cells = bytearray(size * self.width)
+        # bitboards indexed by colour code, index 0 is unused
+        self.bits = [0, 0, 0]
+        self.history = []
+        # Zobrist hash of the stones, kept up to date by play and undo
+        self.hash = 0
+        self.stone_keys = zobrist_keys(size)
+        # Step between two neighbour cells for each direction
+        self.steps = [di * self.width + dj for di, dj in DIRECTIONS]
+        # Number of maximal runs of each length in the four directions,
+        # indexed by colour code then length
+        self.runs = [[0] * (size + 1) for _ in range(3)]
+        # Number of stones close to each cell, and bitboard of the empty
+        # cells close to a stone where the search plays
+        self.neighbours = neighbour_indexes(size)
+        self.near = bytearray(len(self.cells))
+        self.frontier = 0
+
+    @classmethod
+    def from_rows(cls, rows):
+        '''
+        Build a board from a list of rows of "vide", "noir" and "blanc"
+        '''
+        board = cls(len(rows))
+        for i, row in enumerate(rows):
+            for j, color in enumerate(row):
+                if color != "vide":
+                    board.play(i, j, color)
+        return board
+
+    def moves(self):
+        '''
+        Played stones in order, as (i, j, colour)
+        '''
+        return [(i, j, self[i, j]) for (i, j) in self.history]
+
+    def to_rows(self):
+        return [[self[i, j] for j in range(self.size)] for i in range(self.size)]
+
+    def copy(self):
+        board = Board(self.size)
+        board.cells = self.cells[:]
+        board.bits = self.bits[:]
+        board.history = self.history[:]
+        board.hash = self.hash
+        board.runs = [runs[:] for runs in self.runs]
+        board.near = self.near[:]
+        board.frontier = self.frontier
+        return board
+
+    def __getitem__(self, position):
+        return COLORS[self.cells[position[0] * self.width + position[1]]]
+
+    def inside(self, i, j):
+        return 0 <= i < self.size and 0 <= j < self.size
+
+    def is_empty(self, i, j):
+        return self.cells[i * self.width + j] == 0
+
+    def play(self, i, j, color):
+        index = i * self.width + j
+        code = COLOR_CODES[color]
+        self.cells[index] = code
+        self.bits[code] |= 1 << index
+        self.hash ^= self.stone_keys[code][index]
+        self.history.append((i, j))
+        cells = self.cells
+        near = self.near
+        frontier = self.frontier & ~(1 << index)
+        for neighbour in self.neighbours[index]:
+            near[neighbour] += 1
+            if cells[neighbour] == 0:
+                frontier |= 1 << neighbour
+        self.frontier = frontier
+        # The new stone joins the runs on each side of it
+        runs = self.runs[code]
+        for step in self.steps:
+            before = self.run_length(index, -step, code)
+            after = self.run_length(index, step, code)
+            if before:
+                runs[before] -= 1
+            if after:
+                runs[after] -= 1
+            runs[before + after + 1] += 1
+
+    def undo(self):
+        '''
+        Remove the last played stone and return its position
+        '''
+        i, j = self.history.pop()
+        index = i * self.width + j
+        code = self.cells[index]
+        self.bits[code] &= ~(1 << index)
+        self.hash ^= self.stone_keys[code][index]
+        self.cells[index] = 0
+        near = self.near
+        frontier = self.frontier
+        for neighbour in self.neighbours[index]:
+            near[neighbour] -= 1
+            if near[neighbour] == 0:
+                frontier &= ~(1 << neighbour)
+        if near[index]:
+            frontier |= 1 << index
+        self.frontier = frontier
+        # The run through the stone splits back in two
+        runs = self.runs[code]
+        for step in self.steps:
+            before = self.run_length(index, -step, code)
+            after = self.run_length(index, step, code)
+            runs[before + after + 1] -= 1
+            if before:
+                runs[before] += 1
+            if after:
+                runs[after] += 1
+        return i, j
+
+    def run_length(self, index, step, code):
+        '''
+        Number of stones of a colour following the cell index in a direction
+        The padding column stops the horizontal and diagonal runs at the edge
+        '''
+        cells = self.cells
+        length = 0
+        index += step
+        while 0 <= index < len(cells) and cells[index] == code:
+            length += 1
+            index += step
+        return length
+
+    def run_through(self, i, j):
+        '''
+        Length of the longest line of stones through the stone at (i, j),
+        read from the four lines through it only
+        '''
+        index = i * self.width + j
+        code = self.cells[index]
+        return max(self.run_length(index, -step, code) + self.run_length(index, step, code)
+                   for step in self.steps) + 1
+
+    def longest_run(self, color):
+        '''
+        Length of the longest line of stones of a colour
+        '''
+        runs = self.runs[COLOR_CODES[color]]
+        for length in range(self.size, 0, -1):
+            if runs[length]:
+                return length
+        return 0
+
+    @property
+    def occupied(self):
+        '''
+        Bitboard of all the stones on the board
+        '''
+        return self.bits[1] | self.bits[2]
+
+    def count(self, color):
+        return self.bits[COLOR_CODES[color]].bit_count()
+
+    def stones(self, color):
+        '''
+        Positions of the stones of a colour, row by row
+        '''
+        positions = []
+        bits = self.bits[COLOR_CODES[color]]
+        width = self.width
+        while bits:
+            low = bits & -bits
+            index = low.bit_length() - 1
+            positions.append(divmod(index, width))
+            bits ^= low
+        return positions
+
+    def candidate_moves(self):
+        '''
+        Empty squares close to a stone, row by row
+        '''
+        moves = []
+        bits = self.frontier
+        width = self.width
+        while bits:
+            low = bits & -bits
+            index = low.bit_length() - 1
+            moves.append(list(divmod(index, width)))
+            bits ^= low
+        return moves
+
+    def line(self, i, j, direction):
+        '''
+        Positions of the whole board line going through (i, j) in a direction
+        '''
+        di, dj = direction
+        while self.inside(i - di, j - dj):
+            i, j = i - di, j - dj
+        positions = []
+        while self.inside(i, j):
+            positions.append((i, j))
+            i, j = i + di, j + dj
+        return positions
+
+    def stone_key(self, code, i, j):
+        return self.stone_keys[code][i * self.width + j]
+
+    def bounds(self):
+        '''
+        First and last rows and columns of the board, as (top, left, bottom, right)
+        '''
+        return 0, 0, self.size - 1, self.size - 1
+
+    def pattern_lines(self, code):
+        '''
+        Board lines holding a stone of colour code, as (positions, cell codes)
+        '''
+        own = self.bits[code]
+        cells = self.cells
+        for positions, indexes, mask in board_lines(self.size):
+            if own & mask:
+                yield positions, [cells[index] for index in indexes]
+
+    def lines_at(self, i, j):
+        '''
+        Board lines going through (i, j), as (positions, cell codes, offset
+        of (i, j) in the line)
+        '''
+        cells = self.cells
+        for (positions, indexes, mask), offset in cell_lines(self.size)[i * self.width + j]:
+            yield positions, [cells[index] for index in indexes], offset
+
+
+def line_key(direction, i, j):
+    '''
+    (line number, offset along the line) of (i, j) for a direction index of
+    DIRECTIONS, the offset growing by one at each step in the direction
+    '''
+    if direction == 0:
+        return i, j
+    if direction == 1:
+        return j, i
+    if direction == 2:
+        return j - i, i
+    return i + j, j
+
+
+def line_position(direction, number, offset):
+    if direction == 0:
+        return number, offset
+    if direction == 1:
+        return offset, number
+    if direction == 2:
+        return offset, offset + number
+    return number - offset, offset
+
+
+def sparse_zobrist_key(code, i, j):
+    '''
+    64 bits key of a stone of colour code at (i, j) on a SparseBoard,
+    mixed from the position with splitmix64 instead of read from a table
+    '''
+    x = ((i & 0xFFFFFFF) << 30 | (j & 0xFFFFFFF) << 2 | code) + ZOBRIST_SEED * 0x9E3779B97F4A7C15
+    x &= 0xFFFFFFFFFFFFFFFF
+    x = (x ^ (x >> 30)) * 0xBF58476D1CE4E5B9 & 0xFFFFFFFFFFFFFFFF
+    x = (x ^ (x >> 27)) * 0x94D049BB133111EB & 0xFFFFFFFFFFFFFFFF
+    return x ^ (x >> 31)
+
+
+# Cells of the windows of six going through a cell, on each side
+WINDOW_REACH = 5
+
+
+class SparseBoard:
+    '''
+    Gomoku board storing only its stones, for large boards and for the
+    unbounded board of size None
+    Each line of stones of a colour is indexed by (direction, line number)
+    with the offsets of its stones along the line, so that every scan costs
+    in proportion to the number of stones and not to the board area.
+    It has the interface of Board that the engine uses
+    '''
+
+    def __init__(self, size=None):
+        self.size = size
+        # (i, j) -> colour code of the stones
+        self.cells = {}
+        self.history = []
+        self.hash = 0
+        # Offsets of the stones of each colour code along each line
+        self.lines = [None, {}, {}]
+        # Runs of each length, as in Board
+        self.runs = [None, {}, {}]
+        # Number of stones close to each cell, and the empty cells close to a stone
+        self.near = {}
+        self.frontier = set()
+
+    def moves(self):
+        return [(i, j, self[i, j]) for (i, j) in self.history]
+
+    def to_rows(self):
+        if self.size is None:
+            top, left, bottom, right = self.bounds()
+        else:
+            top, left, bottom, right = 0, 0, self.size - 1, self.size - 1
+        return [[self[i, j] for j in range(left, right + 1)] for i in range(top, bottom + 1)]
+
+    def copy(self):
+        board = SparseBoard(self.size)
+        for i, j, color in self.moves():
+            board.play(i, j, color)
+        return board
+
+    def __getitem__(self, position):
+        return COLORS[self.cells.get((position[0], position[1]), 0)]
+
+    def inside(self, i, j):
+        return self.size is None or (0 <= i < self.size and 0 <= j < self.size)
+
+    def is_empty(self, i, j):
+        return (i, j) not in self.cells
+
+    def line_span(self, direction, number):
+        '''
+        First and last offsets of a line inside the board
+        '''
+        if self.size is None:
+            return -math.inf, math.inf
+        last = self.size - 1
+        if direction < 2:
+            return 0, last
+        if direction == 2:
+            return max(0, -number), min(last, last - number)
+        return max(0, number - last), min(last, number)
+
+    def line_order(self, line):
+        direction, number = line
+        if self.size is None:
+            return direction, (number, 0)
+        return direction, line_position(direction, number, self.line_span(direction, number)[0])
+
+    def play(self, i, j, color):
+        code = COLOR_CODES[color]
+        self.cells[(i, j)] = code
+        self.hash ^= sparse_zobrist_key(code, i, j)
+        self.history.append((i, j))
+        self.frontier.discard((i, j))
+        near = self.near
+        for x in range(i - FRONTIER_DISTANCE, i + FRONTIER_DISTANCE + 1):
+            for y in range(j - FRONTIER_DISTANCE, j + FRONTIER_DISTANCE + 1):
+                if (x, y) != (i, j) and self.inside(x, y):
+                    near[(x, y)] = near.get((x, y), 0) + 1
+                    if (x, y) not in self.cells:
+                        self.frontier.add((x, y))
+        lines = self.lines[code]
+        runs = self.runs[code]
+        for direction, (di, dj) in enumerate(DIRECTIONS):
+            number, offset = line_key(direction, i, j)
+            lines.setdefault((direction, number), set()).add(offset)
+            before = self.run_length(i, j, -di, -dj, code)
+            after = self.run_length(i, j, di, dj, code)
+            if before:
+                runs[before] -= 1
+            if after:
+                runs[after] -= 1
+            runs[before + after + 1] = runs.get(before + after + 1, 0) + 1
+
+    def undo(self):
+        i, j = self.history.pop()
+        code = self.cells.pop((i, j))
+        self.hash ^= sparse_zobrist_key(code, i, j)
+        near = self.near
+        for x in range(i - FRONTIER_DISTANCE, i + FRONTIER_DISTANCE + 1):
+            for y in range(j - FRONTIER_DISTANCE, j + FRONTIER_DISTANCE + 1):
+                if (x, y) != (i, j) and self.inside(x, y):
+                    near[(x, y)] -= 1
+                    if not near[(x, y)]:
+                        del near[(x, y)]
+                        self.frontier.discard((x, y))
+        if near.get((i, j)):
+            self.frontier.add((i, j))
+        lines = self.lines[code]
+        runs = self.runs[code]
+        for direction, (di, dj) in enumerate(DIRECTIONS):
+            number, offset = line_key(direction, i, j)
+            offsets = lines[(direction, number)]
+            offsets.discard(offset)
+            if not offsets:
+                del lines[(direction, number)]
+            before = self.run_length(i, j, -di, -dj, code)
+            after = self.run_length(i, j, di, dj, code)
+            runs[before + after + 1] -= 1
+            if before:
+                runs[before] += 1
+            if after:
+                runs[after] += 1
+        return i, j
+
+    def run_length(self, i, j, di, dj, code):
+        '''
+        Number of stones of a colour following (i, j) in a direction
+        '''
+        cells = self.cells
+        length = 0
+        i += di
+        j += dj
+        while cells.get((i, j)) == code:
+            length += 1
+            i += di
+            j += dj
+        return length
+
+    def run_through(self, i, j):
+        code = self.cells[(i, j)]
+        return max(self.run_length(i, j, -di, -dj, code) + self.run_length(i, j, di, dj, code)
+                   for di, dj in DIRECTIONS) + 1
+
+    def longest_run(self, color):
+        return max((length for length, count in self.runs[COLOR_CODES[color]].items() if count),
+                   default=0)
+
+    def count(self, color):
+        code = COLOR_CODES[color]
+        return sum(1 for stone in self.cells.values() if stone == code)
+
+    def stones(self, color):
+        code = COLOR_CODES[color]
+        return sorted(position for position, stone in self.cells.items() if stone == code)
+
+    def candidate_moves(self):
+        return [[i, j] for i, j in sorted(self.frontier)]
+
+    def stone_key(self, code, i, j):
+        return sparse_zobrist_key(code, i, j)
+
+    def bounds(self):
+        '''
+        Rows and columns around the stones, as (top, left, bottom, right)
+        '''
+        if not self.cells:
+            center = self.size // 2 if self.size is not None else 0
+            return center, center, center, center
+        rows = [i for i, j in self.cells]
+        columns = [j for i, j in self.cells]
+        top, left = min(rows) - FRONTIER_DISTANCE, min(columns) - FRONTIER_DISTANCE
+        bottom, right = max(rows) + FRONTIER_DISTANCE, max(columns) + FRONTIER_DISTANCE
+        if self.size is not None:
+            top, left = max(top, 0), max(left, 0)
+            bottom, right = min(bottom, self.size - 1), min(right, self.size - 1)
+        return top, left, bottom, right
+
+    def segment(self, direction, number, first, last):
+        '''
+        Positions and cell codes of a line between two offsets
+        '''
+        cells = self.cells
+        positions = [line_position(direction, number, offset)
+                     for offset in range(first, last + 1)]
+        return positions, [cells.get(position, 0) for position in positions]
+
+    def pattern_lines(self, code):
+        '''
+        Segments of the lines holding a stone of colour code, cut to the
+        cells at most WINDOW_REACH cells away from such a stone so that every
+        window of six holding one of these stones is in a segment. The lines
+        come in the order of board_lines, by direction then first cell
+        '''
+        lines = self.lines[code]
+        for direction, number in sorted(lines, key=self.line_order):
+            offsets = lines[(direction, number)]
+            low, high = self.line_span(direction, number)
+            first = last = None
+            for offset in sorted(offsets):
+                if last is not None and offset - WINDOW_REACH <= last + 1:
+                    last = min(offset + WINDOW_REACH, high)
+                    continue
+                if last is not None:
+                    yield self.segment(direction, number, first, last)
+                first = max(offset - WINDOW_REACH, low)
+                last = min(offset + WINDOW_REACH, high)
+            if last is not None:
+                yield self.segment(direction, number, first, last)
+
+    def lines_at(self, i, j):
+        for direction in range(len(DIRECTIONS)):
+            number, offset = line_key(direction, i, j)
+            low, high = self.line_span(direction, number)
+            first = max(offset - WINDOW_REACH, low)
+            last = min(offset + WINDOW_REACH, high)
+            positions, codes = self.segment(direction, number, first, last)
+            yield positions, codes, offset - first
+
+
+def make_board(size=15):
+    '''
+    Empty board of a size, stored as bitboards up to DENSE_BOARD_LIMIT and
+    sparsely above or when size is None for an unbounded board
+    '''
+    if size is not None and size <= DENSE_BOARD_LIMIT:
+        return Board(size)
+    return SparseBoard(size)
+
+
 def draw_board():
+    # matplotlib is only imported once a board is drawn
+    import matplotlib.pyplot as plt
     # create a figure to draw the board
     fig = plt.figure(figsize=[9, 9])
     # set the background color
@@ -30,19 +652,19 @@ def draw_board():
     return fig, ax
 
 
-def draw_grids(ax):
+def draw_grids(ax, size=15):
     # draw the vertical lines
-    for x in range(16):
-        ax.plot([x, x], [0, 15], 'k')
+    for x in range(size + 1):
+        ax.plot([x, x], [0, size], 'k')
     # draw the horizontal lines
-    for y in range(16):
-        ax.plot([0, 15], [y, y], 'k')
+    for y in range(size + 1):
+        ax.plot([0, size], [y, y], 'k')
 
     ax.set_position([0, 0, 1, 1])
 
 
-def draw_coordinates(ax, x, y):
-    ax.text(x + 0.1, y + 0.1, str(14 - y) + "," + str(x), fontsize=9)
+def draw_coordinates(ax, x, y, size=15):
+    ax.text(x + 0.1, y + 0.1, str(size - 1 - y) + "," + str(x), fontsize=9)
 
 
 def draw_pawn(ax, x, y, color):
@@ -50,121 +672,162 @@ def draw_pawn(ax, x, y, color):
     y = y + 0.5
     markeredgecolor = (0, 0, 0) if color == "noir" else (1, 1, 1)
     markerfacecolor = 'k' if color == "noir" else 'w'
-    ax.plot(x, y, 'o', markersize=20,
-            markeredgecolor=markeredgecolor,
-            markerfacecolor=markerfacecolor,
-            markeredgewidth=1)
+    artist, = ax.plot(x, y, 'o', markersize=20,
+                      markeredgecolor=markeredgecolor,
+                      markerfacecolor=markerfacecolor,
+                      markeredgewidth=1)
+    return artist
 
 
-def render_board(p):
-    fig, ax = draw_board()
+class MatplotlibRenderer:
+    '''
+    Board drawn in a matplotlib figure kept open from one turn to the next
+    The grid and the coordinates are drawn once, then each render only adds
+    the pawns played and removes the pawns undone since the previous one
+    '''
 
-    for i in range(15):
-        for j in range(15):
-            draw_coordinates(ax, i, j)
-            if p[i][j] == "blanc":
-                draw_pawn(ax, j, 14 - i, "blanc")
-            elif p[i][j] == "noir":
-                draw_pawn(ax, j, 14 - i, "noir")
+    def __init__(self):
+        self.fig = None
+        self.ax = None
+        # Moves drawn, as (i, j, colour), and the artist of each pawn
+        self.drawn = []
+        self.pawns = []
 
-    draw_grids(ax)
-    plt.show()
+    def render(self, p):
+        import matplotlib.pyplot as plt
+        if p.size is None:
+            raise ValueError("An unbounded board can only be shown in the terminal")
+        if self.fig is None or not plt.fignum_exists(self.fig.number):
+            plt.ion()
+            self.fig, self.ax = draw_board()
+            for x in range(p.size):
+                for y in range(p.size):
+                    draw_coordinates(self.ax, x, y, p.size)
+            draw_grids(self.ax, p.size)
+            self.drawn = []
+            self.pawns = []
+        moves = p.moves()
+        same = 0
+        while same < min(len(moves), len(self.drawn)) and moves[same] == self.drawn[same]:
+            same += 1
+        for artist in self.pawns[same:]:
+            artist.remove()
+        del self.pawns[same:]
+        for i, j, color in moves[same:]:
+            self.pawns.append(draw_pawn(self.ax, j, p.size - 1 - i, color))
+        self.drawn = moves
+        self.fig.canvas.draw_idle()
+        plt.pause(0.001)
+
+
+class TerminalRenderer:
+    '''
+    Board printed with ANSI colours, the last move underlined
+    '''
+    PAWNS = {"noir": bcolors.FAIL + "X" + bcolors.ENDC,
+             "blanc": bcolors.OKCYAN + "O" + bcolors.ENDC}
+
+    def __init__(self, file=None):
+        self.file = file
+
+    def text(self, p):
+        last = p.history[-1] if p.history else None
+        top, left, bottom, right = p.bounds()
+        lines = ["    " + "".join("{:>4}".format(j) for j in range(left, right + 1))]
+        for i in range(top, bottom + 1):
+            row = "{:>4}".format(i)
+            for j in range(left, right + 1):
+                color = p[i, j]
+                if color == "vide":
+                    row += "   ."
+                elif (i, j) == last:
+                    row += "   " + bcolors.BOLD + bcolors.UNDERLINE + self.PAWNS[color]
+                else:
+                    row += "   " + self.PAWNS[color]
+            lines.append(row)
+        return "\n".join(lines)
+
+    def render(self, p):
+        print(self.text(p), file=self.file)
+
+
+class NullRenderer:
+    def render(self, p):
+        pass
+
+
+RENDERERS = {"matplotlib": MatplotlibRenderer, "terminal": TerminalRenderer,
+             "none": NullRenderer}
 
 
 def get_all_pawns_of_color(p, color):
-    pawns = []
-    for i in range(15):
-        for j in range(15):
-            if p[i][j] == color:
-                pawns.append([i, j])
-    return pawns
+    return [[i, j] for (i, j) in p.stones(color)]
 
 
-def remove_duplicates_groups(groups):
+def run_index(p, color, min_length=1):
     '''
-    Remove a group if it's part of another group
+    Positions of the maximal runs of at least min_length stones of color, in
+    the direction of the line, keyed by (direction, line number, first
+    offset, last offset) as numbered by line_key. A run is walked once, from
+    its first stone, in each direction
     '''
-    # print(groups)
-    new_groups = []
-    for group in groups:
-        subset = False
-        for child_group in groups:
-            if set(group).issubset(set(child_group)) and group != child_group:
-                subset = True
-                break
-        if not subset:
-            new_groups.append(group)
-    return new_groups
+    runs = {}
+    stones = p.stones(color)
+    own = set(stones)
+    for (i, j) in stones:
+        for direction, (di, dj) in enumerate(DIRECTIONS):
+            if (i - di, j - dj) in own:
+                # Not the first stone of its run
+                continue
+            positions = [(i, j)]
+            x, y = i + di, j + dj
+            while (x, y) in own:
+                positions.append((x, y))
+                x, y = x + di, y + dj
+            if len(positions) < min_length:
+                continue
+            number, first = line_key(direction, i, j)
+            runs[(direction, number, first, first + len(positions) - 1)] = positions
+    return runs
 
 
 def find_grouped_aligned_pawns_combinations(p, color):
     '''
     Find all the combinations of aligned pawns of a given color
     It can be horizontal, vertical or diagonal
+    Each group is a maximal run of at least two pawns, from its first pawn
     '''
-    group = []
-    for (i, j) in get_all_pawns_of_color(p, color):
-        combinations_v = []
-        # We check up to 5 pawns in a row
-        # Vertical
-        is_something = False
-        for k in range(1, 6):
-            if i + k < 15:
-                if p[i + k][j] == color:
-                    is_something = True
-                    combinations_v.append((i + k, j))
-                else:
-                    break
-        if is_something:
-            combinations_v.insert(0, (i, j))
-        combinations_h = []
-        # Horizontal
-        is_something = False
-        for k in range(1, 6):
-            if j + k < 15:
-                if p[i][j + k] == color:
-                    is_something = True
-                    combinations_h.append((i, j + k))
-                else:
-                    break
-        if is_something:
-            combinations_h.insert(0, (i, j))
-        combinations_d1 = []
-        # Diagonal
-        is_something = False
-        for k in range(1, 6):
-            if i + k < 15 and j + k < 15:
-                if p[i + k][j + k] == color:
-                    is_something = True
-                    combinations_d1.append((i + k, j + k))
-                else:
-                    break
-        if is_something:
-            combinations_d1.insert(0, (i, j))
-        combinations_d2 = []
-        # Diagonal
-        is_something = False
-        for k in range(1, 6):
-            if i - k >= 0 and j + k < 15:
-                if p[i - k][j + k] == color:
-                    is_something = True
-                    combinations_d2.append((i - k, j + k))
-                else:
-                    break
-        if is_something:
-            combinations_d2.insert(0, (i, j))
+    groups = sorted((positions[0], direction, positions)
+                    for (direction, *_), positions in run_index(p, color, 2).items())
+    return [positions for _, _, positions in groups]
+
 
-        if combinations_h:
-            group.append(combinations_h)
-        if combinations_v:
-            group.append(combinations_v)
-        if combinations_d1:
-            group.append(combinations_d1)
-        if combinations_d2:
-            group.append(combinations_d2)
+def evaluate(p, color):
+    '''
+    Length of the longest group of aligned pawns of a colour, counted up to
+    6 pawns, read from the run counts kept by the board
+    '''
+    length = p.longest_run(color)
+    return min(length, 6) if length >= 2 else 0
 
-    group = remove_duplicates_groups(group)
-    return group
+
+def last_move_wins(p):
+    '''
+    Whether the last move made five in a row, from the four lines through it
+    '''
+    return bool(p.history) and p.run_through(*p.history[-1]) >= 5
+
+
+def game_over(p):
+    '''
+    Colour that won with the last move, "vide" when the board is full, or
+    None while the game goes on
+    '''
+    if last_move_wins(p):
+        return p[p.history[-1]]
+    if p.size is not None and len(p.history) == p.size * p.size:
+        return "vide"
+    return None
 
 
 def gravity_center(p, color):
@@ -178,12 +841,16 @@ def possible_moves(p, position, margin):
     '''
     Find all the possible move of a pawn around a given position
     '''
+    rows = range(position[0] - margin, position[0] + margin + 1)
+    columns = range(position[1] - margin, position[1] + margin + 1)
+    if p.size is not None:
+        rows = range(max(rows.start, 0), min(rows.stop, p.size))
+        columns = range(max(columns.start, 0), min(columns.stop, p.size))
     moves = []
-    for i in range(position[0] - margin, position[0] + margin + 1):
-        for j in range(position[1] - margin, position[1] + margin + 1):
-            if i >= 0 and i < 15 and j >= 0 and j < 15:
-                if p[i][j] == "vide":
-                    moves.append([i, j])
+    for i in rows:
+        for j in columns:
+            if p.is_empty(i, j):
+                moves.append([i, j])
     return moves
 
 
@@ -192,363 +859,1571 @@ def closest_empty_positions(p, from_position):
     Find the closest empty position to a given position
     '''
     positions = []
-    for margin in range(15):
+    # An unbounded board has an empty square closer than its number of stones
+    for margin in range(p.size or len(p.history) + 1):
         moves = possible_moves(p, from_position, margin)
         for move in moves:
-            if p[move[0]][move[1]] == "vide":
+            if p.is_empty(move[0], move[1]):
                 positions.append(move)
         if positions:
             break
-    print("closest empty positions", positions)
+    logger.debug("closest empty positions %s", positions)
     return positions
 
 
-def minmax(position, depth, alpha, beta, maximizingPlayer, maximazingPlayerColor, p):
-    print(position)
-    # deep copy of the board
-    p_copy = deepcopy(p)
+class TranspositionTable:
+    '''
+    Fixed size table of search results indexed by Zobrist key
+    Each slot keeps (key, depth, score, bound, best move, generation).
+    A slot is replaced by a search at least as deep, by another result for
+    the same position or when it was written during an earlier turn
+    '''
+    EXACT = 0
+    LOWER = 1
+    UPPER = 2
+
+    def __init__(self, bits=18):
+        self.mask = (1 << bits) - 1
+        self.entries = [None] * (1 << bits)
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+
+    def new_search(self):
+        '''
+        Age the entries at the start of a new turn
+        '''
+        self.generation += 1
+
+    def lookup(self, key):
+        entry = self.entries[key & self.mask]
+        if entry is not None and entry[0] == key:
+            self.hits += 1
+            return entry
+        self.misses += 1
+        return None
+
+    def store(self, key, depth, score, bound, best_move):
+        index = key & self.mask
+        entry = self.entries[index]
+        if entry is None or entry[0] == key or depth >= entry[1] or entry[5] != self.generation:
+            self.entries[index] = (key, depth, score, bound,
+                                   best_move, self.generation)
+            self.stores += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "stores": self.stores,
+                "hit_rate": self.hits / lookups if lookups else 0.0}
+
+
+class SearchTimeout(Exception):
+    '''
+    Raised inside minmax when the time or node budget of the search is spent
+    '''
+
+
+class SearchLimits:
+    '''
+    Time and node budget of a search, and count of the nodes visited
+    '''
+
+    def __init__(self, time_limit=None, node_limit=None, deadline=None, cancel=None):
+        if time_limit is not None:
+            deadline = time.monotonic() + time_limit
+        self.deadline = deadline
+        self.node_limit = node_limit
+        # threading.Event set by another thread to stop the search
+        self.cancel = cancel
+        self.nodes = 0
+
+    def check(self):
+        '''
+        Count a node and stop the search once the budget is spent or the
+        search is cancelled. The clock and the event are only read every
+        16 nodes
+        '''
+        self.nodes += 1
+        if self.node_limit is not None and self.nodes > self.node_limit:
+            raise SearchTimeout()
+        if not self.nodes & 15:
+            if self.deadline is not None and time.monotonic() >= self.deadline:
+                raise SearchTimeout()
+            if self.cancel is not None and self.cancel.is_set():
+                raise SearchTimeout()
+
+
+class MoveOrdering:
+    '''
+    Order in which minmax tries the moves of a node, to get the alpha-beta
+    cutoffs early: the transposition table move, then the moves making or
+    blocking a threat of three or more, then the killer moves of the depth,
+    then the others by history score
+    The threats are only looked for at THREAT_DEPTH and above: one scan of
+    the lines costs more than searching the children of a node just above
+    the leaves
+    Also counts the cutoffs of the search
+    '''
+    KILLERS = 2
+    THREAT_DEPTH = 3
+
+    def __init__(self):
+        # Moves that caused a cutoff at each remaining depth, latest first
+        self.killers = {}
+        # Sum of depth² of the cutoffs caused by each square
+        self.history = {}
+        self.nodes = 0
+        self.cutoffs = 0
+        self.first_move_cutoffs = 0
+        self.moves_searched = 0
+
+    def order(self, p, moves, depth, tt_move, color):
+        threats = both_threat_scores(p, color) if depth >= self.THREAT_DEPTH else {}
+        killers = self.killers.get(depth, [])
+        history = self.history
+
+        def key(move):
+            square = (move[0], move[1])
+            if move == tt_move:
+                return (0, 0, 0)
+            threat = threats.get(square, 0)
+            if threat >= 3:
+                return (1, -threat, -history.get(square, 0))
+            if square in killers:
+                return (2, killers.index(square), 0)
+            return (3, -history.get(square, 0), 0)
+        moves.sort(key=key)
+        return moves
+
+    def searched(self, move, depth, count, cutoff):
+        '''
+        Record a node where count moves were searched, the last one causing a
+        cutoff when cutoff is True
+        '''
+        self.nodes += 1
+        self.moves_searched += count
+        if not cutoff:
+            return
+        self.cutoffs += 1
+        if count == 1:
+            self.first_move_cutoffs += 1
+        square = (move[0], move[1])
+        killers = self.killers.setdefault(depth, [])
+        if square in killers:
+            killers.remove(square)
+        killers.insert(0, square)
+        del killers[self.KILLERS:]
+        self.history[square] = self.history.get(square, 0) + depth * depth
+
+    def stats(self):
+        return {"nodes": self.nodes, "cutoffs": self.cutoffs,
+                "cutoff_rate": self.cutoffs / self.nodes if self.nodes else 0.0,
+                "first_move_cutoff_rate": self.first_move_cutoffs / self.cutoffs if self.cutoffs else 0.0,
+                "moves_per_node": self.moves_searched / self.nodes if self.nodes else 0.0}
+
+
+class SearchTrace:
+    '''
+    Counters of the searches of one move and JSON record of each move
+    Tracing is off unless a trace is given to choose_move, the searches
+    then count their nodes, leaves, cutoffs and transposition table cutoffs.
+    Nodes searched by the processes of a RootSearchPool are not counted
+    '''
+
+    def __init__(self):
+        self.moves = []
+        self.branches = {}
+        self.reset()
+
+    def reset(self):
+        self.nodes = 0
+        self.leaves = 0
+        self.cutoffs = 0
+        self.tt_cutoffs = 0
+
+    def counters(self):
+        return {"nodes": self.nodes, "leaves": self.leaves,
+                "cutoffs": self.cutoffs, "tt_cutoffs": self.tt_cutoffs}
+
+    def record(self, p, color, move, info, seconds):
+        '''
+        Add the record of a move chosen in seconds by the rule of info
+        The time is also summed per rule in branches
+        '''
+        branch = self.branches.setdefault(info["branch"], {"moves": 0, "seconds": 0.0})
+        branch["moves"] += 1
+        branch["seconds"] += seconds
+        entry = {"ply": len(p.history), "color": color, "move": [move[0], move[1]],
+                 "seconds": seconds, **info, "counters": self.counters()}
+        entry["nodes_per_second"] = self.nodes / seconds if seconds else 0.0
+        self.moves.append(entry)
+        return entry
+
+    def dump(self, path):
+        '''
+        Write the moves, one JSON object per line
+        '''
+        with open(path, "w") as f:
+            for entry in self.moves:
+                f.write(json.dumps(entry) + "\n")
+
+
+def minmax(position, depth, alpha, beta, maximizingPlayer, maximazingPlayerColor, p, tt=None, limits=None,
+           ordering=None, trace=None):
+    '''
+    Alpha-beta search from the move at position
+    The move is played on the shared board p and undone before returning,
+    so the board is never copied and is left unchanged for the caller
+    Results are kept in the transposition table tt when one is given,
+    SearchTimeout is raised when the budget of limits is spent, the moves
+    are sorted by ordering and the nodes are counted by trace
+    '''
+    if limits is not None:
+        limits.check()
+    if trace is not None:
+        trace.nodes += 1
     if depth == 0:
-        pf = find_grouped_aligned_pawns_combinations(
-            p_copy, maximazingPlayerColor)
-        print("pf", pf)
-        return len(max(pf, key=len)) if pf else 0
+        if trace is not None:
+            trace.leaves += 1
+        return evaluate(p, maximazingPlayerColor)
 
     if maximizingPlayer:
-        p_copy[position[0]][position[1]] = maximazingPlayerColor
-        best_score = -math.inf
-        for move in possible_moves(p_copy, position, 2):
-            score = minmax(move, depth - 1, alpha, beta,
-                           False, maximazingPlayerColor, p_copy)
-            best_score = max(best_score, score)
-            alpha = max(alpha, best_score)
-            if beta <= alpha:
-                break
-        return best_score
+        p.play(position[0], position[1], maximazingPlayerColor)
     else:
-        p_copy[position[0]][position[1]
-                            ] = "noir" if maximazingPlayerColor == "blanc" else "blanc"
-        best_score = math.inf
-        for move in possible_moves(p_copy, position, 2):
-            score = minmax(move, depth - 1, alpha, beta,
-                           True, maximazingPlayerColor, p_copy)
-            best_score = min(best_score, score)
-            beta = min(beta, best_score)
-            if beta <= alpha:
-                break
+        p.play(position[0], position[1], opponent(maximazingPlayerColor))
+    try:
+        if p.run_through(position[0], position[1]) >= 5:
+            # Decided position, nothing left to search
+            if trace is not None:
+                trace.leaves += 1
+            return WIN_SCORE if maximizingPlayer else -WIN_SCORE
+        moves = p.candidate_moves()
+        if depth == 1 and moves:
+            # Every child is a leaf evaluating this same board
+            if trace is not None:
+                trace.leaves += 1
+            return evaluate(p, maximazingPlayerColor)
+        tt_move = None
+        if tt is not None:
+            # the children depend on the side and the colour
+            key = p.hash ^ ZOBRIST_COLOR[maximazingPlayerColor]
+            if maximizingPlayer:
+                key ^= ZOBRIST_MAXIMIZING
+            entry = tt.lookup(key)
+            if entry is not None:
+                _, entry_depth, entry_score, bound, tt_move, _ = entry
+                if entry_depth == depth and (
+                        bound == TranspositionTable.EXACT
+                        or (bound == TranspositionTable.LOWER and entry_score >= beta)
+                        or (bound == TranspositionTable.UPPER and entry_score <= alpha)):
+                    if trace is not None:
+                        trace.tt_cutoffs += 1
+                    return entry_score
+            alpha_origin = alpha
+            beta_origin = beta
+        if ordering is not None:
+            ordering.order(p, moves, depth, tt_move, maximazingPlayerColor)
+        elif tt_move in moves:
+            # Try the best move of the previous search first
+            moves.remove(tt_move)
+            moves.insert(0, tt_move)
+
+        best_move = None
+        searched = 0
+        if maximizingPlayer:
+            best_score = -math.inf
+            for move in moves:
+                searched += 1
+                score = minmax(move, depth - 1, alpha, beta,
+                               False, maximazingPlayerColor, p, tt, limits, ordering, trace)
+                if score > best_score:
+                    best_score = score
+                    best_move = move
+                alpha = max(alpha, best_score)
+                if beta <= alpha:
+                    break
+        else:
+            best_score = math.inf
+            for move in moves:
+                searched += 1
+                score = minmax(move, depth - 1, alpha, beta,
+                               True, maximazingPlayerColor, p, tt, limits, ordering, trace)
+                if score < best_score:
+                    best_score = score
+                    best_move = move
+                beta = min(beta, best_score)
+                if beta <= alpha:
+                    break
+        if ordering is not None and searched:
+            ordering.searched(move, depth, searched, beta <= alpha)
+        if trace is not None and searched and beta <= alpha:
+            trace.cutoffs += 1
+
+        if tt is not None:
+            if best_score <= alpha_origin:
+                bound = TranspositionTable.UPPER
+            elif best_score >= beta_origin:
+                bound = TranspositionTable.LOWER
+            else:
+                bound = TranspositionTable.EXACT
+            tt.store(key, depth, best_score, bound, best_move)
         return best_score
+    finally:
+        p.undo()
+
+
+# State of a RootSearchPool worker process
+_root_worker = {}
+
+
+def _init_root_worker(bound):
+    _root_worker["bound"] = bound
+    _root_worker["tt"] = TranspositionTable()
+    _root_worker["ordering"] = MoveOrdering()
 
 
-def is_threat_ok(position, p):
-    agir = False
-    print("Doit on neutralise cette menace", position)
-    if position[0] < 0 or position[1] < 0:
-        agir = False
-    elif p[position[0]][position[1]] == "vide":
-        agir = True
-    print("résultat ", agir)
-    return agir
-
-
-def find_threats(groupAdv, pointsAdv, p):
-    print("Recherche de menace")
-    print("à partir des groupes de pions :", groupAdv)
-
-    solo_pawns = [[x] for x in pointsAdv]
-    combined = groupAdv + solo_pawns
-    threat = []
-    for index, ligne in enumerate(combined):
-        # 3 tuples
-        if len(ligne) == 3:
-            # horizontal colonnes qui changent
-            if ligne[0][0] == ligne[1][0] and ligne[0][0] == ligne[2][0]:
-                agirpositionDroit = (ligne[0][0], ligne[2][1]+1)
-                agirDroit = is_threat_ok(agirpositionDroit, p)
-                agirpositionGauche = (ligne[0][0], ligne[0][1]-1)
-                agirGauche = is_threat_ok(agirpositionGauche, p)
-                if agirDroit:
-                    threat.append((*agirpositionDroit, len(ligne) + 1))
-                    threat.append
-                if agirGauche:
-                    threat.append((*agirpositionGauche, len(ligne) + 1))
-            # vertical points qui changent
-            elif ligne[0][1] == ligne[1][1] and ligne[0][1] == ligne[2][1]:
-                agirpositionHaut = (ligne[2][0]+1, ligne[0][1])
-                agirHaut = is_threat_ok(agirpositionHaut, p)
-                agirpositionBas = (ligne[0][0]-1, ligne[0][1])
-                agirBas = is_threat_ok(agirpositionBas, p)
-                if agirHaut:
-                    threat.append((*agirpositionHaut, len(ligne) + 1))
-                if agirBas:
-                    threat.append((*agirpositionBas, len(ligne) + 1))
-             # diagonale
+def _search_root_candidates(moves, size, positions, depth, maximizingPlayer, color, deadline, node_limit):
+    '''
+    Search a batch of root candidates in a worker process, on one board
+    built from moves, node_limit covering the whole batch
+    Returns (scores, nodes), scores being None when the budget was spent
+    '''
+    board = make_board(size)
+    for i, j, stone in moves:
+        board.play(i, j, stone)
+    bound = _root_worker["bound"]
+    limits = SearchLimits(node_limit=node_limit, deadline=deadline)
+    scores = []
+    for position in positions:
+        # Scores are integers: a window one point wider than the best root
+        # score so far still gives the exact score of any candidate that
+        # ties with it, so the same candidate as in the sequential search is
+        # chosen
+        if maximizingPlayer:
+            alpha, beta = bound.value - 1, math.inf
+        else:
+            alpha, beta = -math.inf, bound.value + 1
+        try:
+            score = minmax(position, depth, alpha, beta, maximizingPlayer,
+                           color, board, _root_worker["tt"], limits, _root_worker["ordering"])
+        except SearchTimeout:
+            return None, limits.nodes
+        with bound.get_lock():
+            if maximizingPlayer:
+                bound.value = max(bound.value, score)
             else:
-                if ligne[0][0]+1 == ligne[1][0]:
-                    agirpositionDiagBas = (ligne[2][0]+1, ligne[2][1]+1)
-                    agirDiagBas = is_threat_ok(agirpositionDiagBas, p)
-                    agirpositionDiagHaut = (ligne[0][0]-1, ligne[0][1]-1)
-                    agirDiagHaut = is_threat_ok(agirpositionDiagHaut, p)
-                    if agirDiagBas:
-                        threat.append((*agirpositionDiagBas, len(ligne) + 1))
-                    if agirDiagHaut:
-                        threat.append((*agirpositionDiagHaut, len(ligne) + 1))
-                else:
-                    agirpositionDiagBas = (ligne[0][0]+1, ligne[0][1]-1)
-                    agirDiagBas = is_threat_ok(agirpositionDiagBas, p)
-                    agirpositionDiagHaut = (ligne[2][0]-1, ligne[2][1]+1)
-                    agirDiagHaut = is_threat_ok(agirpositionDiagHaut, p)
-                    if agirDiagBas:
-                        threat.append((*agirpositionDiagBas, len(ligne) + 1))
-                    if agirDiagHaut:
-                        threat.append((*agirpositionDiagHaut, len(ligne) + 1))
-        if len(ligne) == 4:
-            # horizontal colonnes qui changent
-            if ligne[0][0] == ligne[1][0] and ligne[0][0] == ligne[2][0] and ligne[0][0] == ligne[3][0]:
-                agirpositionDroit = (ligne[0][0], ligne[3][1]+1)
-                agirDroit = is_threat_ok(agirpositionDroit, p)
-                agirpositionGauche = (ligne[0][0], ligne[0][1]-1)
-                agirGauche = is_threat_ok(agirpositionGauche, p)
-                if agirDroit:
-                    threat.append((*agirpositionDroit, len(ligne) + 1))
-                if agirGauche:
-                    threat.append((*agirpositionGauche, len(ligne) + 1))
-            # vertical points qui changent
-            elif ligne[0][1] == ligne[1][1] and ligne[0][1] == ligne[2][1] and ligne[0][1] == ligne[3][1]:
-                agirpositionHaut = (ligne[3][0]+1, ligne[0][1])
-                agirHaut = is_threat_ok(agirpositionHaut, p)
-                agirpositionBas = (ligne[0][0]-1, ligne[0][1])
-                agirBas = is_threat_ok(agirpositionBas, p)
-                if agirHaut:
-                    threat.append((*agirpositionHaut, len(ligne) + 1))
-                if agirBas:
-                    threat.append((*agirpositionBas, len(ligne) + 1))
-             # diagonale
+                bound.value = min(bound.value, score)
+        scores.append(score)
+    return scores, limits.nodes
+
+
+class RootSearchPool:
+    '''
+    Process pool splitting the root candidates of a search between workers
+    Each worker gets one batch of candidates, every workers-th one in the
+    order of the search, so that the best candidates of the previous depth
+    start first. The workers share the best root score found so far, which
+    bounds the search of the candidates that start after it. Each worker
+    keeps its own transposition table from one search to the other
+    '''
+
+    def __init__(self, workers=SEARCH_WORKERS):
+        self.workers = workers
+        self.bound = multiprocessing.Value("d", 0.0)
+        self.executor = concurrent.futures.ProcessPoolExecutor(
+            workers, initializer=_init_root_worker, initargs=(self.bound,))
+
+    def search(self, p, candidates, depth, maximizingPlayer, color, limits=None):
+        '''
+        Scores of the candidates at depth, in the order of the candidates
+        Raises SearchTimeout when the candidates could not be searched within
+        the deadline of limits, or within its node limit, the nodes left
+        being shared between the batches in proportion to their candidates
+        '''
+        self.bound.value = -math.inf if maximizingPlayer else math.inf
+        deadline = nodes_left = None
+        if limits is not None:
+            deadline = limits.deadline
+            if limits.node_limit is not None:
+                nodes_left = limits.node_limit - limits.nodes
+        moves = p.moves()
+        batches = [candidates[k::self.workers] for k in range(min(self.workers, len(candidates)))]
+        futures = [self.executor.submit(
+            _search_root_candidates, moves, p.size, batch, depth, maximizingPlayer, color, deadline,
+            nodes_left * len(batch) // len(candidates) if nodes_left is not None else None)
+            for batch in batches]
+        results = [future.result() for future in futures]
+        if limits is not None:
+            limits.nodes += sum(nodes for _, nodes in results)
+        if any(scores is None for scores, _ in results):
+            raise SearchTimeout()
+        scores = [None] * len(candidates)
+        for k, (batch_scores, _) in enumerate(results):
+            scores[k::self.workers] = batch_scores
+        return scores
+
+    def close(self):
+        self.executor.shutdown(cancel_futures=True)
+
+
+def iterative_deepening(p, candidates, maximizingPlayer, color, tt=None,
+                        time_limit=None, node_limit=None, max_depth=MAX_DEPTH, pool=None,
+                        ordering=None, trace=None, limits=None):
+    '''
+    Search the candidates at depth 1, 2, 3... until the time or node budget
+    is spent, each depth starting with the best candidates of the previous
+    one. The candidates are split between the processes of pool if given
+    limits replaces the budget of time_limit and node_limit when given
+    Returns (best position, score, depth) of the last completed depth
+    '''
+    if limits is None:
+        limits = SearchLimits(time_limit, node_limit)
+    order = list(candidates)
+    best = (order[0], None, 0)
+    for depth in range(1, max_depth + 1):
+        try:
+            if pool is not None:
+                scores = pool.search(p, order, depth,
+                                     maximizingPlayer, color, limits)
             else:
-                if ligne[0][0]+1 == ligne[1][0]:
-                    agirpositionDiagBas = (ligne[3][0]+1, ligne[3][1]+1)
-                    agirDiagBas = is_threat_ok(agirpositionDiagBas, p)
-                    agirpositionDiagHaut = (ligne[0][0]-1, ligne[0][1]-1)
-                    agirDiagHaut = is_threat_ok(agirpositionDiagHaut, p)
-                    if agirDiagBas:
-                        threat.append((*agirpositionDiagBas, len(ligne) + 1))
-                    if agirDiagHaut:
-                        threat.append((*agirpositionDiagHaut, len(ligne) + 1))
-                else:
-                    agirpositionDiagBas = (ligne[0][0]+1, ligne[0][1]-1)
-                    agirDiagBas = is_threat_ok(agirpositionDiagBas, p)
-                    agirpositionDiagHaut = (ligne[3][0]-1, ligne[3][1]+1)
-                    agirDiagHaut = is_threat_ok(agirpositionDiagHaut, p)
-                    if agirDiagBas:
-                        threat.append((*agirpositionDiagBas, len(ligne) + 1))
-                    if agirDiagHaut:
-                        threat.append((*agirpositionDiagHaut, len(ligne) + 1))
-        if len(ligne) == 2:
-            # horizontal colonnes qui changent
-            if ligne[0][0] == ligne[1][0]:
-                agirpositionDroit = (ligne[0][0], ligne[1][1]+1)
-                agirDroit = is_threat_ok(agirpositionDroit, p)
-                agirpositionGauche = (ligne[0][0], ligne[0][1]-1)
-                agirGauche = is_threat_ok(agirpositionGauche, p)
-                if agirDroit:
-                    threat.append((*agirpositionDroit, len(ligne) + 1))
-                if agirGauche:
-                    threat.append((*agirpositionGauche, len(ligne) + 1))
-            # vertical points qui changent
-            elif ligne[0][1] == ligne[1][1]:
-                agirpositionHaut = (ligne[1][0]+1, ligne[0][1])
-                agirHaut = is_threat_ok(agirpositionHaut, p)
-                agirpositionBas = (ligne[0][0]-1, ligne[0][1])
-                agirBas = is_threat_ok(agirpositionBas, p)
-                if agirHaut:
-                    threat.append((*agirpositionHaut, len(ligne) + 1))
-                if agirBas:
-                    threat.append((*agirpositionBas, len(ligne) + 1))
-                # diagonale
-                else:
-                    if ligne[0][0]+1 == ligne[1][0]:
-                        agirpositionDiagBas = (ligne[1][0]+1, ligne[1][1]+1)
-                        agirDiagBas = is_threat_ok(agirpositionDiagBas, p)
-                        agirpositionDiagHaut = (ligne[0][0]-1, ligne[0][1]-1)
-                        agirDiagHaut = is_threat_ok(
-                            agirpositionDiagHaut, p)
-                        if agirDiagBas:
-                            threat.append(
-                                (*agirpositionDiagBas, len(ligne) + 1))
-                        if agirDiagHaut:
-                            threat.append(
-                                (*agirpositionDiagHaut, len(ligne) + 1))
-                    else:
-                        agirpositionDiagBas = (ligne[0][0]+1, ligne[0][1]-1)
-                        agirDiagBas = is_threat_ok(agirpositionDiagBas, p)
-                        agirpositionDiagHaut = (ligne[1][0]-1, ligne[1][1]+1)
-                        agirDiagHaut = is_threat_ok(
-                            agirpositionDiagHaut, p)
-                        if agirDiagBas:
-                            threat.append(
-                                (*agirpositionDiagBas, len(ligne) + 1))
-                        if agirDiagHaut:
-                            threat.append(
-                                (*agirpositionDiagHaut, len(ligne) + 1))
-        #
-        # Can we create a threat by adding a point between two points
-        #
-        for index2, ligne2 in enumerate(combined):
-            # Are the two lignes on the same line
-            if ligne[0][0] == ligne2[0][0]:
-                # Are they separated by only one point
-                if ligne[0][1] == ligne2[0][1] + 2:
-                    print("Menace entre deux lignes (1)")
-                    agirposition = (ligne[0][0], ligne[0][1]-1)
-                    agir = is_threat_ok(agirposition, p)
-                    if agir:
-                        # Count the number of points on the same line connected by the threat
-                        pawn_count = 1
-                        for i, point in enumerate(ligne):
-                            if i < len(ligne2):
-                                if point[0] == ligne2[i][0]:
-                                    pawn_count += 1
-                        for i, point in enumerate(ligne2):
-                            if i < len(ligne):
-                                if point[0] == ligne[i][0]:
-                                    pawn_count += 1
-                        threat.append(
-                            (*agirposition, pawn_count))
-                elif ligne[0][1] == ligne2[0][1] - 2:
-                    print("Menace entre deux lignes (2)")
-                    agirposition = (ligne[0][0], ligne[0][1]+1)
-                    agir = is_threat_ok(agirposition, p)
-                    if agir:
-                        # Count the number of points on the same line connected by the threat
-                        pawn_count = 1
-                        for i, point in enumerate(ligne):
-                            if i < len(ligne2):
-                                if point[0] == ligne2[i][0]:
-                                    pawn_count += 1
-                        for i, point in enumerate(ligne2):
-                            if i < len(ligne):
-                                if point[0] == ligne[i][0]:
-                                    pawn_count += 1
-                        threat.append(
-                            (*agirposition, pawn_count))
-            # Are the two lignes on the same column
-            elif ligne[0][1] == ligne2[0][1]:
-                # Are they separated by only one point
-                if ligne[0][0] == ligne2[0][0] + 2:
-                    print("Menace entre deux lignes (3)")
-                    agirposition = (ligne[0][0]-1, ligne[0][1])
-                    agir = is_threat_ok(agirposition, p)
-                    if agir:
-                        # Count the number of points on the same line connected by the threat
-                        pawn_count = 1
-                        for i, point in enumerate(ligne):
-                            if i < len(ligne2):
-                                if point[0] == ligne2[i][0]:
-                                    pawn_count += 1
-                        for i, point in enumerate(ligne2):
-                            if i < len(ligne):
-                                if point[0] == ligne[i][0]:
-                                    pawn_count += 1
-                        threat.append(
-                            (*agirposition, pawn_count))
-                elif ligne[0][0] == ligne2[0][0] - 2:
-                    print("Menace entre deux lignes (4)")
-                    agirposition = (ligne[0][0]+1, ligne[0][1])
-                    agir = is_threat_ok(agirposition, p)
-                    if agir:
-                        # Count the number of points on the same line connected by the threat
-                        pawn_count = 1
-                        for i, point in enumerate(ligne):
-                            if i < len(ligne2):
-                                if point[0] == ligne2[i][0]:
-                                    pawn_count += 1
-                        for i, point in enumerate(ligne2):
-                            if i < len(ligne):
-                                if point[0] == ligne[i][0]:
-                                    pawn_count += 1
-                        threat.append(
-                            (*agirposition, pawn_count))
-            # Are the two lignes on the same diagonal
-            elif ligne[0][0] == ligne2[0][0] + 2 and ligne[0][1] == ligne2[0][1] + 2:
-                print("Menace entre deux lignes (5)")
-                agirposition = (ligne[0][0]-1, ligne[0][1]-1)
-                agir = is_threat_ok(agirposition, p)
-                if agir:
-                    # Count the number of points on the same diagonal connected by the threat
-                    pawn_count = 2
-                    for i, point in enumerate(ligne):
-                        if i < len(ligne2):
-                            if abs(point[0] - point[1]) == abs(ligne2[i][0] - ligne2[i][1]):
-                                pawn_count += 1
-                    for i, point in enumerate(ligne2):
-                        if i < len(ligne):
-                            if abs(point[0] - point[1]) == abs(ligne[i][0] - ligne[i][1]):
-                                pawn_count += 1
-                    threat.append(
-                        (*agirposition, pawn_count))
-            elif ligne[0][0] == ligne2[0][0] - 2 and ligne[0][1] == ligne2[0][1] - 2:
-                print("Menace entre deux lignes (6)")
-                agirposition = (ligne[0][0]+1, ligne[0][1]+1)
-                agir = is_threat_ok(agirposition, p)
-                if agir:
-                    # Count the number of points on the same diagonal connected by the threat
-                    pawn_count = 2
-                    for i, point in enumerate(ligne):
-                        if i < len(ligne2):
-                            if abs(point[0] - point[1]) == abs(ligne2[i][0] - ligne2[i][1]):
-                                pawn_count += 1
-                    for i, point in enumerate(ligne2):
-                        if i < len(ligne):
-                            if abs(point[0] - point[1]) == abs(ligne[i][0] - ligne[i][1]):
-                                pawn_count += 1
-                    threat.append(
-                        (*agirposition, pawn_count))
-            elif ligne[0][0] == ligne2[0][0] - 2 and ligne[0][1] == ligne2[0][1] + 2:
-                print("Menace entre deux lignes (7)")
-                agirposition = (ligne[0][0]+1, ligne[0][1]-1)
-                agir = is_threat_ok(agirposition, p)
-                if agir:
-                    # Count the number of points on the same diagonal connected by the threat
-                    pawn_count = 2
-                    for i, point in enumerate(ligne):
-                        if i < len(ligne2):
-                            if abs(point[0] + point[1]) == abs(ligne2[i][0] + ligne2[i][1]):
-                                pawn_count += 1
-                    for i, point in enumerate(ligne2):
-                        if i < len(ligne):
-                            if abs(point[0] + point[1]) == abs(ligne[i][0] + ligne[i][1]):
-                                pawn_count += 1
-                    threat.append(
-                        (*agirposition, pawn_count))
-            elif ligne[0][0] == ligne2[0][0] + 2 and ligne[0][1] == ligne2[0][1] - 2:
-                print("Menace entre deux lignes (8)")
-                agirposition = (ligne[0][0]-1, ligne[0][1]+1)
-                agir = is_threat_ok(agirposition, p)
-                if agir:
-                    # Count the number of points on the same line diagonal by the threat
-                    pawn_count = 2
-                    for i, point in enumerate(ligne):
-                        if i < len(ligne2):
-                            if abs(point[0] + point[1]) == abs(ligne2[i][0] + ligne2[i][1]):
-                                pawn_count += 1
-                    for i, point in enumerate(ligne2):
-                        if i < len(ligne):
-                            if abs(point[0] + point[1]) == abs(ligne[i][0] + ligne[i][1]):
-                                pawn_count += 1
-                    threat.append(
-                        (*agirposition, pawn_count))
-
-    # Sort threat by the value of the 3rd element of the inner list
-    threat.sort(key=lambda x: x[2], reverse=True)
-    # Remove duplicates
-    threat = list(dict.fromkeys(threat))
-    print("Threats : ", threat)
+                scores = [minmax(position, depth, -math.inf, math.inf,
+                                 maximizingPlayer, color, p, tt, limits, ordering, trace)
+                          for position in order]
+        except SearchTimeout:
+            break
+        # Stable sort: equal scores keep the order of the previous depth
+        ranked = sorted(range(len(order)), key=lambda k: scores[k],
+                        reverse=maximizingPlayer)
+        order = [order[k] for k in ranked]
+        best = (order[0], scores[ranked[0]], depth)
+        if maximizingPlayer and best[1] >= 5:
+            break
+    return best
+
+
+class Pattern(enum.IntEnum):
+    '''
+    Kind of a window of a line, from the weakest to the strongest
+    '''
+    ONE = 1
+    TWO = 2
+    THREE = 3
+    SPLIT_THREE = 4
+    OPEN_THREE = 5
+    FOUR = 6
+    OPEN_FOUR = 7
+    FIVE = 8
+
+
+def _classify_window(digits):
+    '''
+    Pattern of a window seen by one colour: 0 empty, 1 own pawn, 2 blocked
+    Returns (pattern, number of own pawns, squares where the colour makes
+    the pattern stronger, squares where the opponent has to answer) with
+    the squares as offsets in the window, or None
+    '''
+    if 2 in digits:
+        return None
+    count = digits.count(1)
+    empties = tuple(k for k, digit in enumerate(digits) if digit == 0)
+    if len(digits) == 5:
+        if count == 0:
+            return None
+        kind = (None, Pattern.ONE, Pattern.TWO, Pattern.THREE,
+                Pattern.FOUR, Pattern.FIVE)[count]
+        return kind, count, empties, empties
+    # Windows of six only describe open shapes: both ends must be empty
+    if digits[0] != 0 or digits[5] != 0:
+        return None
+    if count == 4:
+        return Pattern.OPEN_FOUR, 4, (0, 5), (0, 5)
+    if count == 3:
+        gap = empties[1]
+        kind = Pattern.OPEN_THREE if gap in (1, 4) else Pattern.SPLIT_THREE
+        return kind, 3, (gap,), (0, gap, 5)
+    return None
+
+
+def _build_pattern_table(length, code):
+    '''
+    Pattern of every window of a given length for the colour code, indexed
+    by the base 3 number made of the board cell codes of the window
+    '''
+    table = []
+    for window in range(3 ** length):
+        digits = []
+        for _ in range(length):
+            window, cell = divmod(window, 3)
+            digits.append(0 if cell == 0 else 1 if cell == code else 2)
+        digits.reverse()
+        table.append(_classify_window(digits))
+    return table
+
+
+# Built once: PATTERNS_5[colour code][window] and the same for six cells
+PATTERNS_5 = [None] + [_build_pattern_table(5, code) for code in (1, 2)]
+PATTERNS_6 = [None] + [_build_pattern_table(6, code) for code in (1, 2)]
+_board_lines = {}
+
+
+def board_lines(size):
+    '''
+    Lines of at least five cells of a board size, each one as the list of
+    its positions, the list of its cell indexes and the bitboard of its cells
+    '''
+    if size not in _board_lines:
+        board = Board(size)
+        lines = []
+        for direction in DIRECTIONS:
+            starts = set()
+            for i in range(size):
+                for j in range(size):
+                    starts.add(board.line(i, j, direction)[0])
+            for start in sorted(starts):
+                positions = board.line(start[0], start[1], direction)
+                if len(positions) >= 5:
+                    indexes = [i * board.width + j for i, j in positions]
+                    mask = 0
+                    for index in indexes:
+                        mask |= 1 << index
+                    lines.append((positions, indexes, mask))
+        _board_lines[size] = lines
+    return _board_lines[size]
+
+
+_cell_lines = {}
+
+
+def cell_lines(size):
+    '''
+    For each cell index of a board size, the (line, offset of the cell in
+    the line) of the board_lines going through it
+    '''
+    if size not in _cell_lines:
+        through = [[] for _ in range(size * (size + 1))]
+        for line in board_lines(size):
+            for offset, index in enumerate(line[1]):
+                through[index].append((line, offset))
+        _cell_lines[size] = through
+    return _cell_lines[size]
+
+
+def _window_patterns(found, digits, positions, code, length, first, last):
+    '''
+    Add to found the patterns of the windows of a line starting between
+    first and last
+    '''
+    if last < first:
+        return
+    table = (PATTERNS_5 if length == 5 else PATTERNS_6)[code]
+    high = 3 ** (length - 1)
+    window = 0
+    for k in range(first, first + length - 1):
+        window = window * 3 + digits[k]
+    for start in range(first, last + 1):
+        window = window * 3 + digits[start + length - 1]
+        entry = table[window]
+        if entry is not None:
+            kind, count, gains, answers = entry
+            found.append((kind, count,
+                          [positions[start + k] for k in gains],
+                          [positions[start + k] for k in answers]))
+        window -= digits[start] * high
+
+
+def find_patterns(p, color, lengths=(5, 6)):
+    '''
+    Every window of five or six cells along the lines of the board that
+    forms a pattern for color
+    Returns (pattern, number of pawns, squares to play to make it stronger,
+    squares where the opponent has to answer) with board positions
+    '''
+    code = COLOR_CODES[color]
+    found = []
+    for positions, digits in p.pattern_lines(code):
+        for length in lengths:
+            _window_patterns(found, digits, positions, code, length,
+                             0, len(digits) - length)
+    return found
+
+
+def find_patterns_at(p, color, i, j, lengths=(5, 6)):
+    '''
+    Same as find_patterns for the windows going through (i, j) only
+    '''
+    code = COLOR_CODES[color]
+    found = []
+    for positions, digits, offset in p.lines_at(i, j):
+        for length in lengths:
+            _window_patterns(found, digits, positions, code, length,
+                             max(offset - length + 1, 0),
+                             min(offset, len(digits) - length))
+    return found
+
+
+def threat_scores(p, color):
+    '''
+    Number of pawns of color in the best window of five going through each
+    square where a pawn of color lengthens one of its lines, once played
+    '''
+    best = {}
+    for kind, count, gains, answers in find_patterns(p, color, (5,)):
+        for square in gains:
+            if best.get(square, 0) < count + 1:
+                best[square] = count + 1
+    return best
+
+
+def both_threat_scores(p, color):
+    '''
+    Biggest threat_scores of color and of its opponent on each square
+    '''
+    threats = threat_scores(p, color)
+    for square, score in threat_scores(p, opponent(color)).items():
+        if threats.get(square, 0) < score:
+            threats[square] = score
+    return threats
+
+
+def _threat_windows(p, color):
+    '''
+    Scores of threat_scores, and the number of windows of five giving each
+    square its score: more of them for a square next to a line than at the
+    far end of its window
+    '''
+    best = {}
+    windows = {}
+    for kind, count, gains, answers in find_patterns(p, color, (5,)):
+        score = count + 1
+        for square in gains:
+            known = best.get(square, 0)
+            if known < score:
+                best[square] = score
+                windows[square] = 1
+            elif known == score:
+                windows[square] += 1
+    return best, windows
+
+
+def find_threats(p, color):
+    '''
+    Squares where a pawn of color lengthens one of its lines, with the number
+    of pawns of color in the best window of five going through the square
+    once it is played, from the biggest threat to the smallest
+    Equal threats are ranked by the number of windows giving the score, so
+    that the squares next to a line come before the far end of its window
+    '''
+    best, windows = _threat_windows(p, color)
+    threat = [(*square, best[square])
+              for square in sorted(best, key=lambda square: (best[square], windows[square]), reverse=True)]
+    logger.debug("Threats : %s", threat)
     return threat
 
+
+def board_array(p):
+    '''
+    Colour codes of a bounded board as a (size, size) int8 NumPy array
+    '''
+    import numpy as np
+    if isinstance(p, Board):
+        return np.frombuffer(bytes(p.cells), dtype=np.int8).reshape(p.size, p.width)[:, :p.size]
+    array = np.zeros((p.size, p.size), dtype=np.int8)
+    for (i, j), code in p.cells.items():
+        array[i, j] = code
+    return array
+
+
+def stack_boards(boards):
+    '''
+    (N, size, size) int8 array of the colour codes of boards of one size
+    '''
+    import numpy as np
+    return np.stack([board_array(p) for p in boards])
+
+
+def evaluate_batch(boards, color):
+    '''
+    Evaluation of N boards at once, given as an (N, size, size) array of
+    colour codes, with array shifts along the four directions
+    Returns (scores, counts, threats):
+    - scores, (N,) the evaluate score of each board for color
+    - counts, (N, 5) the number of windows of five without an opponent
+      pawn holding 1 to 5 pawns of color
+    - threats, (N, size, size) the threat_scores of color, 0 elsewhere
+    '''
+    import numpy as np
+    boards = np.asarray(boards, dtype=np.int8)
+    count, size = boards.shape[0], boards.shape[1]
+    code = COLOR_CODES[color]
+    own = boards == code
+    empty = boards == 0
+    blocked = ~own & ~empty
+    longest = np.zeros(count, dtype=np.int8)
+    counts = np.zeros((count, 5), dtype=np.int64)
+    threats = np.zeros(boards.shape, dtype=np.int8)
+    for direction in DIRECTIONS:
+        cells = _window_cells(size, direction, 5)
+        if cells:
+            pawns = sum(own[cell].astype(np.int8) for cell in cells)
+            pawns[np.logical_or.reduce([blocked[cell] for cell in cells])] = 0
+            for k in range(1, 6):
+                counts[:, k - 1] += (pawns == k).sum(axis=(1, 2))
+            gain = np.where(pawns > 0, pawns + 1, 0).astype(np.int8)
+            for cell in cells:
+                np.maximum(threats[cell], np.where(empty[cell], gain, 0), out=threats[cell])
+        # Lines of k pawns in a row, up to 6
+        for k in range(2, 7):
+            cells = _window_cells(size, direction, k)
+            if not cells:
+                break
+            found = np.logical_and.reduce([own[cell] for cell in cells]).any(axis=(1, 2))
+            if not found.any():
+                break
+            longest[found] = np.maximum(longest[found], k)
+    scores = np.where(longest >= 2, longest, 0)
+    return scores, counts, threats
+
+
+def _window_cells(size, direction, length):
+    '''
+    Slices of an (N, size, size) array giving the t-th cell of every window
+    of length cells inside the board in a direction, for t < length
+    '''
+    di, dj = direction
+    if length > size:
+        return []
+    rows = size - (length - 1) * abs(di)
+    columns = size - (length - 1) * dj
+    first = (length - 1) if di < 0 else 0
+    return [(slice(None), slice(first + t * di, first + t * di + rows),
+             slice(t * dj, t * dj + columns)) for t in range(length)]
+
+
+def _five_squares(patterns):
+    '''
+    Squares completing a five in a list of patterns
+    '''
+    return {square for kind, count, gains, answers in patterns
+            if count == 4 for square in gains}
+
+
+def _threat_attack(p, color, depth, threes, limits):
+    '''
+    Winning forcing move of color, to move, or None
+    '''
+    limits.check()
+    patterns = find_patterns(p, color, (5,))
+    fives = _five_squares(patterns)
+    if fives:
+        return min(fives)
+    other = opponent(color)
+    blocks = _five_squares(find_patterns(p, other, (5,)))
+    if depth == 0 or len(blocks) > 1:
+        return None
+    if blocks:
+        # The opponent threatens five: the block is the only move, and it
+        # has to be forcing for the sequence to go on
+        moves = list(blocks)
+    else:
+        # Moves making a four first, then the ones that may make a three
+        fours = {square for kind, count, gains, answers in patterns
+                 if count == 3 for square in gains}
+        moves = sorted(fours)
+        if threes:
+            moves += sorted({square for kind, count, gains, answers in patterns
+                             if count == 2 for square in gains} - fours)
+
+    for move in moves:
+        p.play(move[0], move[1], color)
+        try:
+            local = find_patterns_at(p, color, move[0], move[1])
+            made_fives = _five_squares(local)
+            if len(made_fives) > 1 or any(kind == Pattern.OPEN_FOUR for kind, *_ in local):
+                # Two ways to make five: the opponent can only block one
+                return move
+            if made_fives:
+                replies = made_fives
+            elif threes and any(kind in (Pattern.OPEN_THREE, Pattern.SPLIT_THREE) for kind, *_ in local):
+                # The opponent answers the three or plays a four of his own
+                replies = {square for kind, count, gains, answers in local
+                           if kind in (Pattern.OPEN_THREE, Pattern.SPLIT_THREE)
+                           for square in answers}
+                replies |= {square for kind, count, gains, answers in find_patterns(p, other, (5,))
+                            if count == 3 for square in gains}
+            else:
+                continue
+            for reply in sorted(replies):
+                p.play(reply[0], reply[1], other)
+                try:
+                    refuted = _threat_attack(
+                        p, color, depth - 1, threes, limits) is None
+                finally:
+                    p.undo()
+                if refuted:
+                    break
+            else:
+                return move
+        finally:
+            p.undo()
+    return None
+
+
+def threat_space_search(p, color, threes=True, max_depth=THREAT_SEARCH_DEPTH,
+                        node_limit=THREAT_SEARCH_NODES, deadline=None):
+    '''
+    Look for a forced win of color, to move, made only of fours (VCF) and,
+    when threes is True, of open threes (VCT)
+    Returns the first move of the win, or None when there is none within
+    max_depth forcing moves and node_limit positions, or before deadline
+    '''
+    limits = SearchLimits(node_limit=node_limit, deadline=deadline)
+    try:
+        # Fours alone are cheap to search and win first
+        win = _threat_attack(p, color, max_depth, False, limits)
+        if win is not None or not threes:
+            return win
+        # Threes widen the tree a lot: the shortest wins are searched first
+        for depth in range(1, max_depth + 1):
+            win = _threat_attack(p, color, depth, True, limits)
+            if win is not None:
+                return win
+    except SearchTimeout:
+        pass
+    return None
+
+
+def defend_threat_space(p, color, win, deadline=None):
+    '''
+    Move of color against the forced win of the opponent starting with the
+    move win: the first square of the win or of the opponent threats after
+    which the opponent has no forced win any more, else the square win
+    '''
+    other = opponent(color)
+    candidates = [win] + [square for square, _ in sorted(
+        {(square, count) for kind, count, gains, answers in find_patterns(p, other)
+         if count >= 2 for square in answers}, key=lambda x: -x[1])]
+    tried = set()
+    for square in candidates:
+        if square in tried:
+            continue
+        if deadline is not None and time.monotonic() >= deadline:
+            break
+        tried.add(square)
+        p.play(square[0], square[1], color)
+        try:
+            if threat_space_search(p, other, deadline=deadline) is None:
+                return square
+        finally:
+            p.undo()
+    return win
+
+
+class MCTSNode:
+    '''
+    Node of the Monte Carlo tree, reached by move played by color
+    wins counts the playouts won by color through the node, a draw for half
+    '''
+    __slots__ = ("move", "color", "parent", "children", "untried", "visits", "wins", "winner")
+
+    def __init__(self, move, color, parent):
+        self.move = move
+        self.color = color
+        self.parent = parent
+        self.children = {}
+        # Moves not expanded yet, the most promising last, None before the
+        # first expansion
+        self.untried = None
+        self.visits = 0
+        self.wins = 0.0
+        # color when move makes five
+        self.winner = None
+
+    def select(self, exploration):
+        '''
+        Child with the best UCT value
+        '''
+        log = math.log(self.visits)
+        return max(self.children.values(),
+                   key=lambda child: child.wins / child.visits
+                   + exploration * math.sqrt(log / child.visits))
+
+
+def _expansion_order(p, color):
+    '''
+    Candidate moves of color, to move, sorted so that the squares of the
+    biggest threats of either colour come last and are expanded first
+    '''
+    threats = both_threat_scores(p, color)
+    moves = [(i, j) for i, j in p.candidate_moves()]
+    moves.sort(key=lambda move: threats.get(move, 0))
+    return moves
+
+
+def _makes_five(p, color, square):
+    p.play(square[0], square[1], color)
+    five = last_move_wins(p)
+    p.undo()
+    return five
+
+
+def rollout(p, color, rng, depth=MCTS_ROLLOUT_DEPTH):
+    '''
+    Play the game on from the board p, color to move, for at most depth
+    moves: each side makes five when it can, else blocks the five of the
+    other, else plays a random candidate. The board is left unchanged
+    Returns the colour of the winner, or None
+    '''
+    # Squares completing a five of each colour, kept from the lines of the
+    # moves played; a square may have been blocked since it was added
+    fives = {c: _five_squares(find_patterns(p, c, (5,))) for c in ("noir", "blanc")}
+    played = 0
+    winner = None
+    try:
+        for _ in range(depth):
+            other = opponent(color)
+            move = next((square for square in sorted(fives[color])
+                         if p.is_empty(*square) and _makes_five(p, color, square)), None)
+            if move is None:
+                move = next((square for square in sorted(fives[other])
+                             if p.is_empty(*square) and _makes_five(p, other, square)), None)
+            if move is None:
+                moves = p.candidate_moves()
+                if not moves:
+                    break
+                move = tuple(rng.choice(moves))
+            p.play(move[0], move[1], color)
+            played += 1
+            if last_move_wins(p):
+                winner = color
+                break
+            fives[color] |= _five_squares(find_patterns_at(p, color, move[0], move[1], (5,)))
+            color = other
+    finally:
+        for _ in range(played):
+            p.undo()
+    return winner
+
+
+# State of a MonteCarloTreeSearch worker process
+_mcts_worker = {}
+
+
+def _mcts_worker_search(moves, size, color, deadline, playout_limit):
+    '''
+    Playouts of one worker process for MonteCarloTreeSearch.search
+    Returns the (visits, wins) of the moves of the root and the number of
+    playouts of this search
+    '''
+    if "engine" not in _mcts_worker:
+        _mcts_worker["engine"] = MonteCarloTreeSearch()
+    engine = _mcts_worker["engine"]
+    board = make_board(size)
+    for i, j, stone in moves:
+        board.play(i, j, stone)
+    playouts = engine.run(board, color, deadline, playout_limit)
+    return {move: (child.visits, child.wins) for move, child in engine.root.children.items()}, playouts
+
+
+class MonteCarloTreeSearch:
+    '''
+    UCT search with threat-aware playouts, an alternative to minmax
+    The tree is kept from one move to the next when the new board follows
+    the previous one. With several workers, each process grows its own tree
+    from the same board and the visits of the moves of the roots are summed
+    '''
+
+    def __init__(self, workers=1, exploration=MCTS_EXPLORATION, seed=None):
+        self.workers = workers
+        self.exploration = exploration
+        self.rng = random.Random(seed)
+        self.root = None
+        # Moves of the board at the root of the tree
+        self.root_moves = []
+        self.executor = None
+        if workers > 1:
+            self.executor = concurrent.futures.ProcessPoolExecutor(workers)
+
+    def _set_root(self, p, color):
+        '''
+        Move the root to the board p, color to move, keeping the subtree of
+        the moves played since the last search
+        '''
+        node = self.root
+        if node is not None and p.history[:len(self.root_moves)] == self.root_moves:
+            for move in p.history[len(self.root_moves):]:
+                node = node.children.get(move)
+                if node is None:
+                    break
+        else:
+            node = None
+        if node is None or node.color == color:
+            node = MCTSNode(None, opponent(color), None)
+        node.parent = None
+        self.root = node
+        self.root_moves = list(p.history)
+
+    def run(self, p, color, deadline=None, playout_limit=None):
+        '''
+        Playouts from the board p, color to move, until the deadline or the
+        playout limit
+        '''
+        self._set_root(p, color)
+        playouts = 0
+        while playout_limit is None or playouts < playout_limit:
+            if deadline is not None and time.monotonic() >= deadline:
+                break
+            self._playout(p, self.root)
+            playouts += 1
+        return playouts
+
+    def _playout(self, p, root):
+        node = root
+        played = 0
+        try:
+            # Selection down the expanded nodes
+            while node.winner is None and node.untried == [] and node.children:
+                node = node.select(self.exploration)
+                p.play(node.move[0], node.move[1], node.color)
+                played += 1
+            # Expansion of one move
+            if node.winner is None:
+                color = opponent(node.color)
+                if node.untried is None:
+                    node.untried = _expansion_order(p, color)
+                if node.untried:
+                    move = node.untried.pop()
+                    p.play(move[0], move[1], color)
+                    played += 1
+                    child = MCTSNode(move, color, node)
+                    if p.longest_run(color) >= 5:
+                        child.winner = color
+                    node.children[move] = child
+                    node = child
+            if node.winner is not None:
+                winner = node.winner
+            else:
+                winner = rollout(p, opponent(node.color), self.rng)
+        finally:
+            for _ in range(played):
+                p.undo()
+        while node is not None:
+            node.visits += 1
+            if winner == node.color:
+                node.wins += 1
+            elif winner is None:
+                node.wins += 0.5
+            node = node.parent
+
+    def search(self, p, color, time_limit=None, playout_limit=None):
+        '''
+        Best move of color on the board p, the most visited one, within the
+        time limit or playout limit; one of them is needed
+        Returns (move, dict of statistics)
+        '''
+        if time_limit is None and playout_limit is None:
+            raise ValueError("MonteCarloTreeSearch.search needs a time or playout limit")
+        deadline = time.monotonic() + time_limit if time_limit is not None else None
+        if self.executor is None:
+            playouts = self.run(p, color, deadline, playout_limit)
+            stats = {move: (child.visits, child.wins) for move, child in self.root.children.items()}
+        else:
+            share = -(-playout_limit // self.workers) if playout_limit is not None else None
+            futures = [self.executor.submit(_mcts_worker_search, p.moves(), p.size, color,
+                                            deadline, share)
+                       for _ in range(self.workers)]
+            stats = {}
+            playouts = 0
+            for future in futures:
+                root, played = future.result()
+                playouts += played
+                for move, (visits, wins) in root.items():
+                    total = stats.get(move, (0, 0.0))
+                    stats[move] = (total[0] + visits, total[1] + wins)
+        if not stats:
+            moves = p.candidate_moves()
+            center = p.size // 2 if p.size is not None else 0
+            return (tuple(moves[0]) if moves else (center, center)), {"playouts": playouts}
+        # The visits kept from the previous searches count in the choice,
+        # only the playouts of this search are reported
+        move = max(stats, key=lambda m: (stats[m][0], stats[m][1]))
+        visits, wins = stats[move]
+        return move, {"playouts": playouts,
+                      "visits": visits, "win_rate": wins / visits}
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+
+
+def transform(position, symmetry, size):
+    '''
+    Image of a position by one of the 8 symmetries of the board: the 4
+    rotations, then the 4 reflections
+    '''
+    i, j = position
+    last = size - 1
+    return ((i, j), (j, last - i), (last - i, last - j), (last - j, i),
+            (i, last - j), (j, i), (last - i, j), (last - j, last - i))[symmetry]
+
+
+# Symmetry undoing each symmetry of transform
+INVERSE_SYMMETRY = (0, 3, 2, 1, 4, 5, 6, 7)
+
+
+def canonical_hash(p):
+    '''
+    Smallest Zobrist hash of the board among its 8 symmetries, and the
+    symmetry giving it
+    '''
+    stones = [(i, j, COLOR_CODES[p[i, j]]) for i, j in p.history]
+    best = None
+    for symmetry in range(8):
+        key = 0
+        for i, j, code in stones:
+            x, y = transform((i, j), symmetry, p.size)
+            key ^= p.stone_key(code, x, y)
+        if best is None or key < best[0]:
+            best = (key, symmetry)
+    return best
+
+
+class OpeningBook:
+    '''
+    Book moves of the first plies of the game
+    Positions are stored once for their 8 symmetries, under their canonical
+    hash, with the move in the same orientation and its weight. The file is
+    read the first time the book is used
+    '''
+    MAGIC = b"GMKB"
+    HEADER = struct.Struct("<4sBB")
+    RECORD = struct.Struct("<QBBH")
+    VERSION = 1
+
+    def __init__(self, path=BOOK_PATH, size=15):
+        self.path = path
+        self.size = size
+        self.entries = None
+
+    def _load(self):
+        self.entries = {}
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb") as f:
+            data = f.read()
+        magic, version, size = self.HEADER.unpack_from(data)
+        if magic != self.MAGIC or version != self.VERSION:
+            raise ValueError("Not an opening book: " + self.path)
+        self.size = size
+        for key, i, j, weight in self.RECORD.iter_unpack(data[self.HEADER.size:]):
+            self.entries.setdefault(key, {})[(i, j)] = weight
+
+    def lookup(self, p):
+        '''
+        Book move with the biggest weight for the board, or None
+        '''
+        if self.entries is None:
+            self._load()
+        if p.size != self.size:
+            return None
+        key, symmetry = canonical_hash(p)
+        moves = self.entries.get(key)
+        if not moves:
+            return None
+        move = max(moves, key=lambda m: (moves[m], m))
+        move = transform(move, INVERSE_SYMMETRY[symmetry], p.size)
+        if not p.is_empty(move[0], move[1]):
+            # Hash collision with another position
+            return None
+        return move
+
+    def add(self, p, move, weight=1):
+        if self.entries is None:
+            self._load()
+        key, symmetry = canonical_hash(p)
+        move = transform(move, symmetry, p.size)
+        moves = self.entries.setdefault(key, {})
+        moves[move] = min(moves.get(move, 0) + weight, 0xFFFF)
+
+    def save(self, path=None):
+        if self.entries is None:
+            self._load()
+        with open(path or self.path, "wb") as f:
+            f.write(self.HEADER.pack(self.MAGIC, self.VERSION, self.size))
+            for key in sorted(self.entries):
+                for (i, j), weight in sorted(self.entries[key].items()):
+                    f.write(self.RECORD.pack(key, i, j, weight))
+
+    def __len__(self):
+        if self.entries is None:
+            self._load()
+        return len(self.entries)
+
+
+GameRecord = collections.namedtuple("GameRecord", "size winner moves")
+GameRecord.__doc__ = '''
+Game of a GameArchive: board size, colour of the winner or None, and the
+moves as (i, j), black first
+'''
+
+
+class GameArchive:
+    '''
+    Append-only file of finished games
+    After a header, each game is a record (size, winner code, number of
+    moves) followed by one byte per move, i * size + j, or two bytes on
+    boards bigger than 16. The file is read through mmap, one game at a
+    time, so archives of any length can be scanned
+    '''
+    MAGIC = b"GMKG"
+    HEADER = struct.Struct("<4sB")
+    RECORD = struct.Struct("<BBH")
+    VERSION = 1
+
+    def __init__(self, path=GAMES_PATH):
+        self.path = path
+
+    @staticmethod
+    def holds(p):
+        '''
+        Whether the game of the board p fits in the format: a bounded board
+        of 255 rows or less and 65535 moves or less
+        '''
+        return p.size is not None and p.size <= 255 and len(p.history) <= 0xFFFF
+
+    def append(self, p, winner=None):
+        '''
+        Add the game of the board p, won by winner
+        '''
+        if not self.holds(p):
+            raise ValueError("Only games on boards of 255 rows or less can be archived")
+        squares = [i * p.size + j for i, j in p.history]
+        moves = bytes(squares) if p.size <= 16 else struct.pack("<%dH" % len(squares), *squares)
+        with open(self.path, "ab") as f:
+            if f.tell() == 0:
+                f.write(self.HEADER.pack(self.MAGIC, self.VERSION))
+            f.write(self.RECORD.pack(p.size, COLOR_CODES[winner or "vide"], len(squares)) + moves)
+
+    def __iter__(self):
+        if not os.path.exists(self.path) or not os.path.getsize(self.path):
+            return
+        with open(self.path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            magic, version = self.HEADER.unpack_from(data)
+            if magic != self.MAGIC or version != self.VERSION:
+                raise ValueError("Not a game archive: " + self.path)
+            offset = self.HEADER.size
+            while offset + self.RECORD.size <= len(data):
+                size, winner, count = self.RECORD.unpack_from(data, offset)
+                offset += self.RECORD.size
+                width = 1 if size <= 16 else 2
+                end = offset + count * width
+                if end > len(data):
+                    # Game still being written
+                    break
+                if width == 1:
+                    squares = data[offset:end]
+                else:
+                    squares = struct.unpack_from("<%dH" % count, data, offset)
+                offset = end
+                yield GameRecord(size, COLORS[winner] if winner else None,
+                                 [divmod(square, size) for square in squares])
+
+
+def replay(record):
+    '''
+    Play the moves of a GameRecord on a new board, yielding the board and
+    the colour that just played after each move
+    '''
+    board = make_board(record.size)
+    color = "noir"
+    for i, j in record.moves:
+        board.play(i, j, color)
+        yield board, color
+        color = opponent(color)
+
+
+def winner_of(p):
+    '''
+    Colour with five in a row on the board p, or None
+    '''
+    for color in ("noir", "blanc"):
+        if p.longest_run(color) >= 5:
+            return color
+    return None
+
+
+MOVE_NOTATION = re.compile(r"([a-z]+)([0-9]+)")
+
+
+def move_notation(i, j):
+    '''
+    Compact notation of a move: the column as letters a to z, then aa, ab...
+    followed by the row counted from 1, (7, 7) is h8
+    Raises ValueError on the negative coordinates of an unbounded board
+    '''
+    if i < 0 or j < 0:
+        raise ValueError("no notation for the square ({}, {})".format(i, j))
+    letters = ""
+    j += 1
+    while j:
+        j, letter = divmod(j - 1, 26)
+        letters = chr(ord("a") + letter) + letters
+    return letters + str(i + 1)
+
+
+def parse_moves(text):
+    '''
+    Moves of a position written in compact notation, black first, with or
+    without separators between them: "h8i9h10" or "h8 i9 h10"
+    '''
+    text = text.strip().lower()
+    moves = []
+    end = 0
+    for match in MOVE_NOTATION.finditer(text):
+        if text[end:match.start()].strip(" ,;"):
+            break
+        column = 0
+        for letter in match.group(1):
+            column = column * 26 + ord(letter) - ord("a") + 1
+        moves.append((int(match.group(2)) - 1, column - 1))
+        end = match.end()
+    if text[end:].strip(" ,;"):
+        raise ValueError("invalid position " + text)
+    return moves
+
+
+def position_board(moves, size=BOARD_SIZE):
+    '''
+    Board of the given size after the moves, black first
+    '''
+    board = make_board(size)
+    color = "noir"
+    for i, j in moves:
+        if not board.inside(i, j) or not board.is_empty(i, j):
+            raise ValueError("invalid move " + move_notation(i, j))
+        board.play(i, j, color)
+        color = opponent(color)
+    return board
+
+
+def time_per_move(p, time_left):
+    '''
+    Seconds of time_left, left for a whole game on the bounded board p, that
+    one side can spend on its next move: the time is shared between the
+    moves it can still play, MIN_MOVES_LEFT of them at least
+    '''
+    moves_left = (p.size * p.size - len(p.history)) // 2
+    return max(time_left / max(moves_left, MIN_MOVES_LEFT), 0.0)
+
+
+def percentile(values, rate):
+    '''
+    Nearest-rank percentile of a list of values, None when it is empty
+    '''
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, max(0, round(rate / 100 * len(values)) - 1))]
+
+
+def choose_move(p, color, tt=None, pool=None, book=None,
+                time_limit=MOVE_TIME_LIMIT, node_limit=None, trace=None, mcts=None):
+    '''
+    Move of color on the board p: book move, forced win, block of a forced
+    win of the opponent, then the threat comparison and the minmax search,
+    or the MonteCarloTreeSearch mcts instead of both when one is given
+    time_limit covers the whole choice, node_limit the minmax search or the
+    playouts of mcts
+    Returns the position and a dict telling which rule chose it, the move
+    is also recorded by trace when one is given
+    '''
+    start = time.perf_counter()
+    if trace is not None:
+        trace.reset()
+    position, info = _choose_move(p, color, tt, pool, book, time_limit, node_limit, trace, mcts)
+    if trace is not None:
+        trace.record(p, color, position, info, time.perf_counter() - start)
+    return position, info
+
+
+def _choose_move(p, color, tt, pool, book, time_limit, node_limit, trace, mcts):
+    deadline = time.monotonic() + time_limit if time_limit is not None else None
+    if tt is not None:
+        tt.new_search()
+    # Les premiers coups viennent du livre d'ouverture
+    if book is not None and len(p.history) < BOOK_PLIES:
+        move = book.lookup(p)
+        if move is not None:
+            return move, {"branch": "Livre d'ouverture"}
+    if not p.history:
+        # Pas d'ouverture connue : on place notre pion au centre
+        center = p.size // 2 if p.size is not None else 0
+        return (center, center), {"branch": "Centre"}
+
+    # Un cinq à faire ou à empêcher se joue sans chercher
+    position, win = immediate_move(p, color)
+    if position is not None:
+        return position, {"branch": "Cinq en ligne" if win else "On bloque le quatre de l'adversaire"}
+
+    # On regarde d'abord s'il y a un gain forcé, pour nous
+    # puis pour l'adversaire, avec uniquement des coups forcés
+    our_win = threat_space_search(p, color, deadline=deadline)
+    if our_win:
+        return our_win, {"branch": "Gain forcé"}
+    adv_win = threat_space_search(p, opponent(color), deadline=deadline)
+    if adv_win:
+        return defend_threat_space(p, color, adv_win, deadline), \
+            {"branch": "On bloque le gain forcé de l'adversaire"}
+
+    if deadline is not None:
+        time_limit = max(deadline - time.monotonic(), 0)
+    if mcts is not None:
+        position, stats = mcts.search(p, color, time_limit, node_limit)
+        return position, {"branch": "Monte Carlo", **stats}
+    position, branch, attack = threat_rule(p, color)
+    if position is not None:
+        return position, {"branch": branch}
+    if deadline is not None:
+        time_limit = max(deadline - time.monotonic(), 0)
+    ordering = MoveOrdering()
+    position, score, depth = iterative_deepening(
+        p, p.candidate_moves(), attack, color, tt, time_limit, node_limit,
+        pool=pool, ordering=ordering, trace=trace)
+    info = {"branch": branch, "depth": depth, "score": score}
+    if pool is None:
+        # The processes of a pool order the moves with their own MoveOrdering
+        info["ordering"] = ordering.stats()
+    return position, info
+
+
+def immediate_move(p, color):
+    '''
+    Square where color makes five, else square where the opponent would
+    make five on its next move
+    Returns (position, True for a win) or (None, False)
+    '''
+    fives = _five_squares(find_patterns(p, color, (5,)))
+    if fives:
+        return min(fives), True
+    blocks = _five_squares(find_patterns(p, opponent(color), (5,)))
+    if blocks:
+        return min(blocks), False
+    return None, False
+
+
+def threat_rule(p, color):
+    '''
+    Comparison of the threats of both colours
+    Returns (position, rule, attack): the position is None when the minmax
+    search has to choose the move, attack then telling whether it looks for
+    an attack or a defence
+    '''
+    # On regarde si on doit absolument défendre SI NOTRE MENACE EST PLUS GRANDE QUE LA DEFENSE
+    # ATTAQUER
+    our_thread = find_threats(p, color)
+    # TODO: NE NOUS DONNE PAS LES THREADS LES PLUS IMPORTANTES CAR C QUE DES TUPLES DE COORDONNEES
+    threads = find_threats(p, opponent(color))
+
+    # Si notre menace est plus grande que la menace adverse
+    if ((len(our_thread) > 0 and len(threads) > 0 and our_thread[0][2] > threads[0][2]) or (len(our_thread) > 0 and len(threads) == 0)):
+        return our_thread[0][0:2], "On attaque", True
+    # Si une menace >= 3 est trouvée on la défend en plaçant un pion
+    if len(threads) > 0 and threads[0][2] >= 3:
+        return threads[0][0:2], "On neutralise la menace", False
+
+    # Si on a pas de menace plus élévée mais que la menace adverse n'est pas
+    # très élevée (< 2 pions alignés) on essaye de trouver une attaque parmi
+    # toutes les cases proches d'un pion, sinon on défend
+    attack = len(threads) > 0 and threads[0][2] <= 2
+    return None, "On cherche une attaque" if attack else "On défend", attack
+
+
+def likely_replies(p, color, count=PONDER_MOVES):
+    '''
+    The count moves color is the most likely to play: the squares of the
+    biggest threats of either colour first, then the other candidates
+    '''
+    threats = both_threat_scores(p, color)
+    moves = sorted(p.candidate_moves(), key=lambda move: -threats.get((move[0], move[1]), 0))
+    return [(i, j) for i, j in moves[:count]]
+
+
+class Ponderer:
+    '''
+    Search on the opponent's time
+    A thread plays each likely reply of the opponent on a copy of the board
+    and searches our answer one depth more at a time, round robin over the
+    replies, until stop is called. Its results stay in the transposition
+    table, where the search of our next move finds them
+    '''
+
+    def __init__(self, tt, moves=PONDER_MOVES):
+        self.tt = tt
+        self.moves = moves
+        self.cancel = threading.Event()
+        self.thread = None
+        self.guesses = []
+        # Deepest search completed after each guess
+        self.depths = {}
+
+    def start(self, p, color):
+        '''
+        Ponder the replies of the opponent of color on the board p
+        '''
+        self.stop()
+        self.guesses = likely_replies(p, opponent(color), self.moves) if p.history else []
+        self.depths = {}
+        self.cancel.clear()
+        self.thread = threading.Thread(target=self._ponder, args=(p.copy(), color), daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        '''
+        Stop the search and return the depth reached after each guess
+        '''
+        if self.thread is not None:
+            self.cancel.set()
+            self.thread.join()
+            self.thread = None
+        return self.depths
+
+    def _ponder(self, p, color):
+        limits = SearchLimits(cancel=self.cancel)
+        ordering = MoveOrdering()
+        # Reply of the opponent, side of our search and our candidates in
+        # the order of the last depth searched after it
+        searches = []
+        for i, j in self.guesses:
+            p.play(i, j, opponent(color))
+            # Only the replies leading to a minmax search are worth pondering
+            position, _, attack = threat_rule(p, color)
+            moves = p.candidate_moves()
+            if position is None and moves:
+                searches.append(((i, j), attack, moves))
+            p.undo()
+        for depth in range(1, MAX_DEPTH + 1):
+            for k, ((i, j), attack, order) in enumerate(searches):
+                p.play(i, j, opponent(color))
+                try:
+                    scores = [minmax(position, depth, -math.inf, math.inf,
+                                     attack, color, p, self.tt, limits, ordering)
+                              for position in order]
+                except SearchTimeout:
+                    return
+                finally:
+                    p.undo()
+                # Same ranking as iterative_deepening for the next depth
+                ranked = sorted(range(len(order)), key=lambda n: scores[n], reverse=attack)
+                searches[k] = ((i, j), attack, [order[n] for n in ranked])
+                self.depths[(i, j)] = depth
+
+
 # %%
 
 
 def __main__():
     notre_couleur = input("Couleur de notre pion : ")
-    plateau = [["vide" for _ in range(15)] for _ in range(15)]
+    plateau = make_board(BOARD_SIZE)
 
     au_tour_de = "noir"
 
@@ -562,124 +2437,76 @@ def __main__():
     #plateau[2][6] = "noir"
     #plateau[2][7] = "noir"
 
-    render_board(plateau)
+    if plateau.size is None and RENDERER == "matplotlib":
+        # Un plateau infini ne s'affiche que dans le terminal
+        affichage = TerminalRenderer()
+    else:
+        affichage = RENDERERS[RENDERER]()
+    affichage.render(plateau)
     #print(find_grouped_aligned_pawns_combinations(plateau, "noir"))
 
     terminer = False
     history = []
     history_adv = []
-    if (notre_couleur == "noir"):
-        # On place notre pion au centre
-        plateau[7][7] = "noir"
-        au_tour_de = "blanc"
-        history.append((7, 7))
-    while(not terminer):
-        render_board(plateau)
-        if au_tour_de != notre_couleur:
-            position_adv_y = input("Choix de l'adversaire en vertical : ")
-            position_adv_x = input(
-                "Choix de l'adversaire en horizontal : ")
-            plateau[int(position_adv_y)][int(position_adv_x)] = au_tour_de
-            au_tour_de = "noir" if au_tour_de == "blanc" else "blanc"
-            history_adv.append((int(position_adv_y), int(position_adv_x)))
-        else:
-            best_position = [None, None]
-
-            n_group_pions_adv = find_grouped_aligned_pawns_combinations(
-                plateau, "blanc" if notre_couleur == "noir" else "noir")
-            n_group_pions_notre = find_grouped_aligned_pawns_combinations(
-                plateau, notre_couleur)
-
-            n_pions_adv = get_all_pawns_of_color(
-                plateau, "noir" if notre_couleur == "blanc" else "blanc")
-            n_pions_adv_tuple = [tuple(x) for x in n_pions_adv]
-
-            n_pions_notre = get_all_pawns_of_color(plateau, notre_couleur)
-            n_pions_notre_tuple = [tuple(x) for x in n_pions_notre]
-
-            # Si on est au 2 premier tours et qu'on commence en deuxieme
-            # TOUJOURS PLACER LORS DU DEUXIEME TOUR UN PIONS QUI N'EST PAS
-            # AUTOUR D'UN CARRE 7x7 AUTOUR DU CENTRE
-            # placer les pionts de notre couleur autour de l'énnemi
-            if len(history) < 2 and notre_couleur == "noir":
-                print("Placement initial")
-                available_range_ligne = [0, 1, 2, 3, 4, 11, 12, 13, 14]
-                available_range_colonne = [0, 1, 2, 3, 4, 11, 12, 13, 14]
-                # Select random combination
-                position_ok = False
-                while not position_ok:
-                    random_ligne = random.choice(available_range_ligne)
-                    random_colonne = random.choice(available_range_colonne)
-                    if (plateau[random_ligne][random_colonne] == "vide"):
-                        best_position = (random_ligne, random_colonne)
-                        position_ok = True
+    # Gardée d'un tour à l'autre pour réutiliser les recherches précédentes
+    table = TranspositionTable()
+    # Les processus de recherche ont leurs propres tables : la réflexion
+    # sur le temps adverse remplit celle-ci, la recherche reste alors ici
+    mcts = MonteCarloTreeSearch(SEARCH_WORKERS) if ENGINE == "mcts" else None
+    pool = RootSearchPool() if SEARCH_WORKERS > 1 and not PONDER and mcts is None else None
+    reflexion = Ponderer(table) if PONDER and mcts is None else None
+    livre = OpeningBook()
+    trace = SearchTrace() if TRACE_PATH else None
+    archive = GameArchive(GAMES_PATH) if GAMES_PATH else None
+    try:
+        while(not terminer):
+            affichage.render(plateau)
+            if au_tour_de != notre_couleur:
+                if reflexion is not None:
+                    reflexion.start(plateau, notre_couleur)
+                position_adv_y = input("Choix de l'adversaire en vertical : ")
+                position_adv_x = input(
+                    "Choix de l'adversaire en horizontal : ")
+                if reflexion is not None:
+                    profondeurs = reflexion.stop()
+                    print("Réflexion sur le temps adverse", profondeurs,
+                          "coup prévu" if (int(position_adv_y), int(position_adv_x)) in profondeurs else "coup imprévu")
+                if (not plateau.inside(int(position_adv_y), int(position_adv_x))
+                        or not plateau.is_empty(int(position_adv_y), int(position_adv_x))):
+                    print("Case invalide")
+                    continue
+                plateau.play(int(position_adv_y), int(position_adv_x), au_tour_de)
+                au_tour_de = "noir" if au_tour_de == "blanc" else "blanc"
+                history_adv.append((int(position_adv_y), int(position_adv_x)))
             else:
-                # On regarde si on peut créer une menace
-                # TODO
-                # On regarde si on doit absolument défendre SI NOTRE MENACE EST PLUS GRANDE QUE LA DEFENSE
-                # ATTAQUER
-                our_thread = find_threats(
-                    n_group_pions_notre, n_pions_notre_tuple, plateau)
-                # TODO: NE NOUS DONNE PAS LES THREADS LES PLUS IMPORTANTES CAR C QUE DES TUPLES DE COORDONNEES
-                threads = find_threats(
-                    n_group_pions_adv, n_pions_adv_tuple, plateau)
-
-                # Si notre menace est plus grande que la menace adverse
-                if ((len(our_thread) > 0 and len(threads) > 0 and our_thread[0][2] > threads[0][2]) or (len(our_thread) > 0 and len(threads) == 0)):
-                    print("On attaque")
-                    # On attaque
-                    best_position = our_thread[0][0:2]
-                # Si on a pas de menace plus élévée mais que la menace adverse n'est pas très élevée (< 2 pions alignés)
-                elif (len(threads) > 0 and threads[0][2] <= 2):
-                    print("On cherche une attaque")
-                    best_score = -math.inf
-                    # On essaye de trouver une attaque
-                    if len(n_pions_notre) > 0:
-                        search_point = history[-1]
-                    else:
-                        search_point = tuple(gravity_center(
-                            plateau, "noir" if notre_couleur == "blanc" else "blanc"))
-
-                    for position in closest_empty_positions(plateau, search_point):
-                        score = minmax(position, 4, -math.inf,
-                                       math.inf, True, notre_couleur, plateau)
-                        if score > best_score:
-                            best_score = score
-                            best_position = position
-                            if score == 5:
-                                break
-
-                # Si une menace >= 3 est trouvée on la défend en plaçant un pion
-                elif (len(threads) > 0 and threads[0][2] >= 3):
-                    print("On neutralise la menace")
-                    best_position = threads[0][0:2]
-                # Sinon on défend en utilisant le minmax à partir du dernier coup joué par l'adversaire
-                else:
-                    print("On défend")
-                    best_score = +math.inf
-                    # On essaye de trouver une attaque
-                    if len(n_group_pions_adv) > 0:
-                        search_point = history_adv[-1]
-                    else:
-                        search_point = tuple(gravity_center(
-                            plateau, "noir" if notre_couleur == "blanc" else "blanc"))
-
-                    for position in closest_empty_positions(plateau, search_point):
-                        score = minmax(position, 4, -math.inf,
-                                       math.inf, False, notre_couleur, plateau)
-                        if score < best_score:
-                            best_score = score
-                            best_position = position
-                            if score == 5:
-                                break
-
-            plateau[best_position[0]][best_position[1]] = notre_couleur
-            history.append(best_position)
-            au_tour_de = "noir" if au_tour_de == "blanc" else "blanc"
-
+                best_position, info = choose_move(
+                    plateau, notre_couleur, table, pool, livre, trace=trace, mcts=mcts)
+                print(info)
+                print("Table de transposition", table.stats())
+                if trace is not None:
+                    trace.moves[-1]["tt"] = table.stats()
+                    trace.dump(TRACE_PATH)
+                    print("Temps par règle", trace.branches)
+                plateau.play(best_position[0], best_position[1], notre_couleur)
+                history.append(best_position)
+                au_tour_de = "noir" if au_tour_de == "blanc" else "blanc"
+            # Seules les lignes du dernier coup peuvent finir la partie
+            gagnant = game_over(plateau)
+            if gagnant is not None:
+                terminer = True
+                affichage.render(plateau)
+                print("Match nul" if gagnant == "vide" else "Victoire des " + gagnant)
+    finally:
+        # La partie est gardée même si elle est interrompue
+        if archive is not None and plateau.history:
+            if archive.holds(plateau):
+                archive.append(plateau, winner_of(plateau))
+            else:
+                logger.warning("Game not archived: board of size %s", plateau.size)
 
 # %%
-__main__()
+if __name__ == "__main__":
+    __main__()
 
 # %%
 # %%
\ No newline at end of file
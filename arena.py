@@ -0,0 +1,124 @@
+'''
+Headless engine-vs-engine arena for app.py
+
+    python arena.py --games 1000 --workers 8 --time-a 0.5 --time-b 1.0
+
+Player A and player B swap colours from one game to the next. Each game
+starts with a few random moves so that the games differ, and the games run
+on a process pool. The arena reports the win rates, the game lengths and
+the percentiles of the time taken by each move. With --record the games
+are appended to a game archive, to be studied with games.py.
+'''
+import argparse
+import concurrent.futures
+import os
+import random
+import time
+
+import app
+
+
+def play_game(game, players, random_plies, max_moves, size, seed):
+    '''
+    Play one game between the players A and B, A is black on even games
+    Each player is a dict of choose_move keyword arguments, with the
+    engine name "minmax" or "mcts" under "engine"
+    Returns the winner ("A", "B" or None), the number of moves and the
+    latency of the moves of each player in seconds
+    '''
+    rng = random.Random(seed * 100003 + game)
+    names = ("A", "B") if game % 2 == 0 else ("B", "A")
+    colors = {"noir": names[0], "blanc": names[1]}
+    tables = {name: app.TranspositionTable() for name in ("A", "B")}
+    options = {name: dict(players[name]) for name in ("A", "B")}
+    for name in options:
+        engine = options[name].pop("engine")
+        options[name]["mcts"] = app.MonteCarloTreeSearch(seed=rng.random()) if engine == "mcts" else None
+    book = app.OpeningBook()
+    board = app.make_board(size)
+    latencies = {"A": [], "B": []}
+    color = "noir"
+    winner = None
+    while len(board.history) < max_moves:
+        if board.history and not board.frontier:
+            # No empty square left near the stones
+            break
+        name = colors[color]
+        if 0 < len(board.history) < random_plies:
+            move = tuple(rng.choice(board.candidate_moves()))
+        else:
+            start = time.perf_counter()
+            move, _ = app.choose_move(board, color, tables[name],
+                                      book=book, **options[name])
+            latencies[name].append(time.perf_counter() - start)
+        board.play(move[0], move[1], color)
+        if app.last_move_wins(board):
+            winner = name
+            break
+        color = app.opponent(color)
+    return winner, board.history, latencies
+
+
+def report(results, games):
+    wins = {"A": 0, "B": 0, None: 0}
+    lengths = []
+    latencies = {"A": [], "B": []}
+    for winner, moves, game_latencies in results:
+        wins[winner] += 1
+        lengths.append(len(moves))
+        for name in latencies:
+            latencies[name] += game_latencies[name]
+    print("Parties :", games)
+    print("Victoires A : {:.1%}  B : {:.1%}  nulles : {:.1%}".format(
+        wins["A"] / games, wins["B"] / games, wins[None] / games))
+    print("Longueur des parties : moyenne {:.1f}  médiane {}  min {}  max {}".format(
+        sum(lengths) / games, app.percentile(lengths, 50), min(lengths), max(lengths)))
+    for name in ("A", "B"):
+        if latencies[name]:
+            print("Temps par coup {} : p50 {:.3f}s  p90 {:.3f}s  p99 {:.3f}s  max {:.3f}s".format(
+                name, *(app.percentile(latencies[name], rate) for rate in (50, 90, 99, 100))))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--games", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    for name in ("a", "b"):
+        parser.add_argument("--engine-" + name, choices=("minmax", "mcts"), default="minmax")
+        parser.add_argument("--time-" + name, type=float, default=1.0,
+                            help="seconds of search per move of player " + name.upper())
+        parser.add_argument("--nodes-" + name, type=int, default=None,
+                            help="positions searched, or playouts, per move of player " + name.upper())
+    parser.add_argument("--random-plies", type=int, default=3,
+                        help="random moves at the start of each game")
+    parser.add_argument("--max-moves", type=int, default=225)
+    parser.add_argument("--size", type=int, default=15,
+                        help="board size, 0 for an unbounded board")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--record", help="game archive the games are appended to")
+    args = parser.parse_args()
+
+    if args.record and not 0 < args.size <= 255:
+        parser.error("only boards of 255 rows or less can be recorded")
+
+    players = {"A": {"engine": args.engine_a, "time_limit": args.time_a, "node_limit": args.nodes_a},
+               "B": {"engine": args.engine_b, "time_limit": args.time_b, "node_limit": args.nodes_b}}
+    with concurrent.futures.ProcessPoolExecutor(args.workers) as executor:
+        futures = [executor.submit(play_game, game, players, args.random_plies,
+                                   args.max_moves, args.size or None, args.seed)
+                   for game in range(args.games)]
+        results = [future.result() for future in futures]
+    report(results, args.games)
+    if args.record:
+        archive = app.GameArchive(args.record)
+        for _, moves, _ in results:
+            board = app.make_board(args.size)
+            color = "noir"
+            for i, j in moves:
+                board.play(i, j, color)
+                color = app.opponent(color)
+            archive.append(board, app.winner_of(board))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+'''
+Benchmark suite of the engine of app.py on a fixed corpus of positions
+
+    python bench.py --json bench.json
+    python bench.py --baseline bench.json
+
+For each position of the corpus the minmax search is run by iterative
+deepening up to a fixed depth, measuring the nodes searched, the nodes per
+second and the time until the final best move was first found. The hot
+functions of the engine are then timed one by one on the same positions.
+The results can be written as JSON and compared against a previous run:
+the exit status is 1 when a timing got slower than the tolerance. With
+--workers the same searches are also split over a RootSearchPool of each
+number of processes, to measure how the search time scales.
+'''
+import argparse
+import json
+import math
+import platform
+import sys
+import time
+import timeit
+
+import app
+
+
+# Positions of the corpus: (category, moves from black, colour to move)
+POSITIONS = {
+    "opening-2": ("opening", [(7, 7), (7, 8)], "noir"),
+    "opening-4": ("opening", [(7, 7), (8, 8), (6, 8), (8, 6)], "noir"),
+    "opening-diagonal": ("opening", [(7, 7), (6, 6), (8, 8), (6, 8), (9, 9)], "blanc"),
+    "middlegame-cluster": ("middlegame", [
+        (7, 7), (7, 8), (8, 8), (6, 6), (8, 7), (8, 6), (6, 8), (9, 6),
+        (9, 9), (5, 7), (10, 10), (7, 6)], "noir"),
+    "middlegame-spread": ("middlegame", [
+        (7, 7), (8, 7), (6, 8), (5, 9), (8, 8), (9, 9), (6, 6), (6, 7),
+        (4, 8), (7, 10), (10, 5), (9, 6), (3, 3), (11, 11)], "noir"),
+    "middlegame-edge": ("middlegame", [
+        (0, 0), (1, 1), (0, 1), (2, 2), (1, 0), (0, 2), (14, 14), (13, 13),
+        (14, 13), (12, 12)], "noir"),
+    "tactical-open-three": ("tactical", [
+        (7, 7), (0, 0), (7, 8), (0, 14), (7, 9), (14, 0)], "blanc"),
+    "tactical-four": ("tactical", [
+        (7, 5), (6, 6), (7, 6), (6, 7), (7, 7), (6, 9), (7, 8)], "blanc"),
+    "tactical-double-three": ("tactical", [
+        (7, 7), (0, 0), (7, 8), (0, 14), (8, 6), (14, 0), (9, 6)], "blanc"),
+    "tactical-vcf": ("tactical", [
+        (7, 7), (6, 7), (7, 8), (6, 8), (7, 9), (7, 10), (8, 8), (9, 8),
+        (8, 9), (8, 10), (9, 9)], "blanc"),
+}
+
+
+# Boards evaluated together by the evaluate_batch micro benchmark
+BATCH = 256
+
+
+def make_board(moves, size=15):
+    board = app.make_board(size)
+    color = "noir"
+    for i, j in moves:
+        board.play(i, j, color)
+        color = app.opponent(color)
+    return board
+
+
+def search_position(board, color, depth):
+    '''
+    Iterative deepening of the root candidates of color up to depth
+    Returns the search counters, the elapsed seconds, the best move, its
+    score and the seconds until that move was first ranked best
+    '''
+    tt = app.TranspositionTable()
+    trace = app.SearchTrace()
+    ordering = app.MoveOrdering()
+    order = board.candidate_moves()
+    found_at = {}
+    start = time.perf_counter()
+    for level in range(1, depth + 1):
+        scores = [app.minmax(position, level, -math.inf, math.inf,
+                             True, color, board, tt, None, ordering, trace)
+                  for position in order]
+        ranked = sorted(range(len(order)), key=lambda k: scores[k], reverse=True)
+        order = [order[k] for k in ranked]
+        best = tuple(order[0])
+        found_at.setdefault(best, time.perf_counter() - start)
+        # The best move is only found once it stays best to the last depth
+        found_at = {best: found_at[best]}
+    elapsed = time.perf_counter() - start
+    return trace.counters(), elapsed, best, scores[ranked[0]], found_at[best]
+
+
+def time_call(function, repeat):
+    '''
+    Best time of one call of function, in seconds, over repeat runs
+    '''
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat, number)) / number
+
+
+def micro_benchmarks(board, color, repeat):
+    # The corpus is laid out around the centre of a 15x15 board
+    center = (7, 7)
+    move = board.candidate_moves()[0]
+
+    def play_undo():
+        board.play(move[0], move[1], color)
+        board.undo()
+
+    functions = {
+        "play_undo": play_undo,
+        "candidate_moves": board.candidate_moves,
+        "evaluate": lambda: app.evaluate(board, color),
+        "find_grouped_aligned_pawns_combinations":
+            lambda: app.find_grouped_aligned_pawns_combinations(board, color),
+        "closest_empty_positions": lambda: app.closest_empty_positions(board, center),
+        "find_threats": lambda: app.find_threats(board, color),
+        "threat_space_search": lambda: app.threat_space_search(board, color),
+    }
+    results = {name: time_call(function, repeat) for name, function in functions.items()}
+    if board.size is not None:
+        # Per board, evaluated in stacks of BATCH boards
+        stack = app.stack_boards([board] * BATCH)
+        results["evaluate_batch"] = time_call(lambda: app.evaluate_batch(stack, color), repeat) / BATCH
+    return results
+
+
+def pool_scaling(board, color, depth, pools):
+    '''
+    Seconds of the search of the root candidates of color up to depth,
+    in this process then on each pool, and whether each pool chose the same
+    move as the sequential search
+    '''
+    timings = {}
+    moves = {}
+    for workers, pool in [(1, None)] + list(pools.items()):
+        start = time.perf_counter()
+        # The processes of the pools order their moves with a MoveOrdering too
+        ordering = app.MoveOrdering() if pool is None else None
+        move, _, _ = app.iterative_deepening(board, board.candidate_moves(), True, color,
+                                             app.TranspositionTable(), max_depth=depth, pool=pool,
+                                             ordering=ordering)
+        timings[workers] = time.perf_counter() - start
+        moves[workers] = tuple(move)
+    return {"seconds": timings, "speedup": {workers: timings[1] / seconds if seconds else 0.0
+                                            for workers, seconds in timings.items()},
+            "same_move": all(move == moves[1] for move in moves.values())}
+
+
+def run(depth, repeat, names, size=15, workers=()):
+    results = {"depth": depth, "size": size, "python": platform.python_version(),
+               "machine": platform.machine(), "positions": {}}
+    pools = {count: app.RootSearchPool(count) for count in workers if count > 1}
+    for pool in pools.values():
+        # Start the processes before the first timing
+        pool.search(make_board(POSITIONS["opening-2"][1], size), [(6, 6)], 1, True, "noir")
+    for name in names:
+        category, moves, color = POSITIONS[name]
+        board = make_board(moves, size)
+        counters, elapsed, best, score, to_best = search_position(board, color, depth)
+        results["positions"][name] = {
+            "category": category, **counters, "seconds": elapsed,
+            "nodes_per_second": counters["nodes"] / elapsed if elapsed else 0.0,
+            "best_move": list(best), "score": score, "time_to_best": to_best,
+            "micro": micro_benchmarks(board, color, repeat)}
+        if pools:
+            results["positions"][name]["pool"] = pool_scaling(board, color, depth, pools)
+    for pool in pools.values():
+        pool.close()
+    return results
+
+
+def report(results):
+    print("Profondeur", results["depth"], "- Python", results["python"])
+    print("{:<24} {:>9} {:>10} {:>9} {:>9}  {}".format(
+        "position", "noeuds", "noeuds/s", "temps", "meilleur", "coup"))
+    for name, result in results["positions"].items():
+        print("{:<24} {:>9} {:>10.0f} {:>8.3f}s {:>8.3f}s  {}".format(
+            name, result["nodes"], result["nodes_per_second"], result["seconds"],
+            result["time_to_best"], tuple(result["best_move"])))
+    totals = {}
+    for result in results["positions"].values():
+        for function, seconds in result["micro"].items():
+            totals[function] = totals.get(function, 0.0) + seconds
+    count = len(results["positions"])
+    print("Temps moyen par appel :")
+    for function, seconds in totals.items():
+        print("  {:<40} {:>10.1f} µs".format(function, seconds / count * 1e6))
+    scaling = [result["pool"] for result in results["positions"].values() if "pool" in result]
+    if scaling:
+        print("Recherche répartie sur les processus :")
+        for workers in scaling[0]["seconds"]:
+            seconds = sum(result["seconds"][workers] for result in scaling)
+            print("  {:>2} processus {:>8.3f}s  accélération x{:.2f}".format(
+                workers, seconds, sum(result["seconds"][1] for result in scaling) / seconds))
+        if not all(result["same_move"] for result in scaling):
+            print("  coup différent de la recherche séquentielle :",
+                  [name for name, result in results["positions"].items()
+                   if not result.get("pool", {}).get("same_move", True)])
+
+
+def compare(results, baseline, tolerance):
+    '''
+    Print the timings that changed by more than tolerance against the
+    baseline, and the searches that visited a different number of nodes
+    Returns the number of regressions
+    '''
+    regressions = 0
+    for name, result in results["positions"].items():
+        old = baseline["positions"].get(name)
+        if old is None:
+            continue
+        if result["nodes"] != old["nodes"] or result["best_move"] != old["best_move"]:
+            print("{} : {} noeuds au lieu de {}, coup {} au lieu de {}".format(
+                name, result["nodes"], old["nodes"],
+                tuple(result["best_move"]), tuple(old["best_move"])))
+        timings = [("seconds", result["seconds"], old["seconds"])]
+        timings += [(function, seconds, old["micro"][function])
+                    for function, seconds in result["micro"].items()
+                    if function in old["micro"]]
+        for metric, seconds, old_seconds in timings:
+            if not old_seconds:
+                continue
+            change = seconds / old_seconds - 1
+            if change > tolerance:
+                regressions += 1
+                print("REGRESSION {} {} : {:+.1%}".format(name, metric, change))
+            elif change < -tolerance:
+                print("amélioration {} {} : {:+.1%}".format(name, metric, change))
+    print(regressions, "régression(s) au-delà de {:.0%}".format(tolerance))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--depth", type=int, default=3,
+                        help="depth of the minmax search of each position")
+    parser.add_argument("--repeat", type=int, default=5,
+                        help="runs of each micro benchmark, the best one is kept")
+    parser.add_argument("--size", type=int, default=15,
+                        help="board size, 0 for an unbounded board")
+    parser.add_argument("--positions", nargs="*", choices=sorted(POSITIONS),
+                        default=list(POSITIONS))
+    parser.add_argument("--workers", type=int, nargs="*", default=[],
+                        help="process counts of the RootSearchPool timings, e.g. 2 4 8")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--baseline", help="results of a previous run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.10,
+                        help="slowdown reported as a regression")
+    args = parser.parse_args()
+
+    results = run(args.depth, args.repeat, args.positions, args.size or None, args.workers)
+    report(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if (baseline["depth"], baseline.get("size", 15)) != (results["depth"], results["size"]):
+            parser.error("the baseline was searched at depth {} on size {}".format(
+                baseline["depth"], baseline.get("size", 15)))
+        if compare(results, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
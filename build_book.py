@@ -0,0 +1,74 @@
+'''
+Build or extend the opening book of app.py from engine self-play
+
+    python build_book.py --games 100 --plies 8 --nodes 4000
+
+Each game starts with a few random moves around the centre so that the
+games differ, then both sides play the engine move. Every position reached
+within the first plies is added to the book with the move the engine chose.
+'''
+import argparse
+import random
+
+import app
+
+
+def engine_move(board, color, tt, nodes):
+    '''
+    Move of the engine for color: forced win, block of a forced win of the
+    opponent, else the best minmax move within nodes positions
+    '''
+    win = app.threat_space_search(board, color)
+    if win is not None:
+        return win
+    adv_win = app.threat_space_search(board, app.opponent(color))
+    if adv_win is not None:
+        return app.defend_threat_space(board, color, adv_win)
+    move, _, _ = app.iterative_deepening(
+        board, board.candidate_moves(), True, color, tt,
+        node_limit=nodes, ordering=app.MoveOrdering())
+    return tuple(move)
+
+
+def self_play(book, games, plies, random_plies, nodes, rng):
+    tt = app.TranspositionTable()
+    for game in range(games):
+        board = app.make_board(book.size)
+        center = board.size // 2
+        color = "noir"
+        for ply in range(plies):
+            if not board.history:
+                move = (center, center)
+            elif ply < random_plies:
+                move = tuple(rng.choice(board.candidate_moves()))
+            else:
+                move = engine_move(board, color, tt, nodes)
+                book.add(board, move)
+            board.play(move[0], move[1], color)
+            color = app.opponent(color)
+            tt.new_search()
+        print("Partie", game + 1, "/", games, ":", len(book), "positions")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--book", default=app.BOOK_PATH)
+    parser.add_argument("--games", type=int, default=100)
+    parser.add_argument("--plies", type=int, default=app.BOOK_PLIES)
+    parser.add_argument("--random-plies", type=int, default=2,
+                        help="random moves at the start of each game")
+    parser.add_argument("--nodes", type=int, default=4000,
+                        help="search budget of each engine move")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    book = app.OpeningBook(args.book)
+    # Center first move of black
+    book.add(app.make_board(book.size), (book.size // 2, book.size // 2))
+    self_play(book, args.games, args.plies, args.random_plies,
+              args.nodes, random.Random(args.seed))
+    book.save()
+
+
+if __name__ == "__main__":
+    main()
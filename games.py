@@ -0,0 +1,152 @@
+'''
+Statistics over a game archive of app.py, replayed through the engine
+
+    python games.py games.gmk --limit 100000
+
+The archive is read one game at a time, so its size does not matter. Each
+game is replayed on the engine board and every position is evaluated for
+the side that just played, all the positions of a game in one
+evaluate_batch call, or with evaluate and find_threats with --scalar. The
+report gives the results, the game lengths, the most played openings and,
+by stage of the game, the mean evaluation and threats of the mover.
+'''
+import argparse
+import collections
+import itertools
+
+import app
+
+
+# Plies grouped in one line of the report by stage
+STAGE = 10
+# Openings listed in the report
+TOP_OPENINGS = 10
+
+
+class Statistics:
+    '''
+    Totals over the games of an archive, updated one game at a time
+    '''
+
+    def __init__(self, opening_plies):
+        self.opening_plies = opening_plies
+        self.games = 0
+        self.wins = collections.Counter()
+        self.lengths = collections.Counter()
+        self.openings = collections.Counter()
+        # Per stage: positions, sum of scores, of fours and of fives
+        self.stages = collections.defaultdict(lambda: [0, 0, 0, 0])
+
+    def add_game(self, record):
+        self.games += 1
+        self.wins[record.winner] += 1
+        self.lengths[len(record.moves)] += 1
+        if len(record.moves) >= self.opening_plies:
+            self.openings[tuple(record.moves[:self.opening_plies])] += 1
+
+    def add_position(self, ply, score, fours, fives):
+        '''
+        Evaluation of the position after the ply-th move for its player:
+        its score, the squares giving it four and the squares giving it five
+        '''
+        stage = self.stages[ply // STAGE]
+        stage[0] += 1
+        stage[1] += score
+        stage[2] += fours
+        stage[3] += fives
+
+
+def scalar_positions(record):
+    '''
+    (score, fours, fives) of each position of record, with evaluate and
+    find_threats
+    '''
+    for board, color in app.replay(record):
+        threats = collections.Counter(score for *_, score in app.find_threats(board, color))
+        yield app.evaluate(board, color), threats[4], threats[5]
+
+
+def batch_positions(record):
+    '''
+    (score, fours, fives) of each position of record, with evaluate_batch on
+    the positions played by each colour
+    '''
+    import numpy as np
+    arrays = [app.board_array(board).copy() for board, _ in app.replay(record)]
+    if not arrays:
+        return []
+    results = [None] * len(arrays)
+    for first, color in enumerate(("noir", "blanc")):
+        plies = range(first, len(arrays), 2)
+        if not plies:
+            continue
+        scores, _, threats = app.evaluate_batch(np.stack([arrays[k] for k in plies]), color)
+        fours = (threats == 4).sum(axis=(1, 2))
+        fives = (threats == 5).sum(axis=(1, 2))
+        for n, ply in enumerate(plies):
+            results[ply] = (int(scores[n]), int(fours[n]), int(fives[n]))
+    return results
+
+
+def collect(archive, limit, opening_plies, scalar):
+    statistics = Statistics(opening_plies)
+    positions = scalar_positions if scalar else batch_positions
+    for record in itertools.islice(archive, limit):
+        statistics.add_game(record)
+        for ply, evaluation in enumerate(positions(record)):
+            statistics.add_position(ply, *evaluation)
+    return statistics
+
+
+def median(counter):
+    '''
+    Median of the values counted by counter
+    '''
+    middle = (sum(counter.values()) + 1) // 2
+    seen = 0
+    for value in sorted(counter):
+        seen += counter[value]
+        if seen >= middle:
+            return value
+    return None
+
+
+def report(statistics):
+    games = statistics.games
+    print("Parties :", games)
+    if not games:
+        return
+    print("Victoires noir : {:.1%}  blanc : {:.1%}  nulles : {:.1%}".format(
+        *(statistics.wins[winner] / games for winner in ("noir", "blanc", None))))
+    lengths = statistics.lengths
+    print("Longueur des parties : moyenne {:.1f}  médiane {}  min {}  max {}".format(
+        sum(length * count for length, count in lengths.items()) / games,
+        median(lengths), min(lengths), max(lengths)))
+    print("Ouvertures les plus jouées :")
+    for moves, count in statistics.openings.most_common(TOP_OPENINGS):
+        print("  {:>6}  {}".format(count, " ".join("{},{}".format(*move) for move in moves)))
+    print("{:>9} {:>10} {:>8} {:>8} {:>8}".format("coups", "positions", "score", "quatre", "cinq"))
+    for stage in sorted(statistics.stages):
+        count, score, fours, fives = statistics.stages[stage]
+        print("{:>4}-{:<4} {:>10} {:>8.2f} {:>8.2f} {:>8.2f}".format(
+            stage * STAGE + 1, (stage + 1) * STAGE, count,
+            score / count, fours / count, fives / count))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("archive", nargs="?", default=app.GAMES_PATH)
+    parser.add_argument("--limit", type=int, default=None,
+                        help="games read from the start of the archive")
+    parser.add_argument("--opening-plies", type=int, default=3,
+                        help="moves making an opening")
+    parser.add_argument("--scalar", action="store_true",
+                        help="evaluate with evaluate and find_threats instead of NumPy")
+    args = parser.parse_args()
+
+    report(collect(app.GameArchive(args.archive), args.limit,
+                   args.opening_plies, args.scalar))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+'''
+Resident engine speaking the Gomocup protocol on stdin and stdout
+
+    python gomocup.py
+
+The manager sends one command per line: START, RESTART, BEGIN, TURN,
+BOARD, TAKEBACK, INFO, ABOUT and END. Coordinates are written x,y where x
+is the column and y the row. The transposition table, the opening book and
+the search processes are created by the first command that needs them and
+kept for all the following moves and games. With GOMOKU_PONDER=1 the engine
+searches on the opponent's time until the next command arrives, and with
+GOMOKU_ENGINE=mcts it searches with Monte Carlo playouts instead of minmax.
+Each game is appended to the archive of GOMOKU_GAMES when the next one
+starts or the manager ends the session.
+'''
+import sys
+
+import app
+
+
+ABOUT = 'name="minmax", version="1.0", author="gomoku", country="FR"'
+
+# Part of the time limit of a turn kept for answering the manager
+TIME_MARGIN = 0.1
+
+
+class ProtocolEngine:
+    '''
+    State of the engine between the commands of the manager
+    '''
+
+    def __init__(self):
+        self.board = None
+        self.color = None
+        self.info = {}
+        self.tt = None
+        self.book = None
+        self.pool = None
+        self.mcts = None
+        self.ponderer = None
+        self.archive = app.GameArchive(app.GAMES_PATH) if app.GAMES_PATH else None
+        # Stones read by the current BOARD command, None outside of it, and
+        # its lines that are not stones
+        self.position = None
+        self.board_errors = []
+
+    def turn_time(self):
+        '''
+        Seconds of search for the next move, within the turn and match
+        time limits sent by INFO
+        '''
+        limits = []
+        if "timeout_turn" in self.info:
+            limits.append(int(self.info["timeout_turn"]) / 1000)
+        if "time_left" in self.info and int(self.info.get("timeout_match", 1)):
+            limits.append(app.time_per_move(self.board, int(self.info["time_left"]) / 1000))
+        if not limits:
+            return app.MOVE_TIME_LIMIT
+        return max(min(limits) * (1 - TIME_MARGIN), 0.0)
+
+    def save_game(self):
+        '''
+        Append the current game to the archive, if any move was played
+        '''
+        if self.archive is None or self.board is None or not self.board.history:
+            return
+        if self.archive.holds(self.board):
+            self.archive.append(self.board, app.winner_of(self.board))
+        else:
+            app.logger.warning("Game not archived: board of size %s", self.board.size)
+
+    def new_game(self, size):
+        self.save_game()
+        if self.tt is None:
+            self.tt = app.TranspositionTable()
+            self.book = app.OpeningBook()
+            if app.ENGINE == "mcts":
+                self.mcts = app.MonteCarloTreeSearch(app.SEARCH_WORKERS)
+            elif app.PONDER:
+                self.ponderer = app.Ponderer(self.tt)
+            elif app.SEARCH_WORKERS > 1:
+                self.pool = app.RootSearchPool()
+        self.board = app.make_board(size)
+        self.color = None
+
+    def parse_move(self, text):
+        x, y = (int(value) for value in text.split(",")[:2])
+        if not self.board.inside(y, x) or not self.board.is_empty(y, x):
+            raise ValueError("invalid move " + text)
+        return y, x
+
+    def move(self):
+        '''
+        Play and return the move of the engine
+        '''
+        if self.color is None:
+            self.color = "noir" if len(self.board.history) % 2 == 0 else "blanc"
+        (i, j), _ = app.choose_move(self.board, self.color, self.tt, self.pool,
+                                    self.book, self.turn_time(), mcts=self.mcts)
+        self.board.play(i, j, self.color)
+        if self.ponderer is not None:
+            self.ponderer.start(self.board, self.color)
+        return "{},{}".format(j, i)
+
+    def handle(self, line):
+        '''
+        Answer to one line of the manager, None when there is nothing to say
+        '''
+        if self.ponderer is not None:
+            self.ponderer.stop()
+        if self.position is not None:
+            return self.board_line(line)
+        command, _, argument = line.strip().partition(" ")
+        command = command.upper()
+        if command == "START":
+            size = int(argument)
+            if size < 5:
+                return "ERROR unsupported size " + argument
+            self.new_game(size)
+            return "OK"
+        if command == "ABOUT":
+            return ABOUT
+        if command == "INFO":
+            key, _, value = argument.partition(" ")
+            self.info[key] = value
+            return None
+        if command == "END":
+            self.save_game()
+            raise SystemExit()
+        if self.board is None:
+            return "ERROR no game started"
+        if command == "RESTART":
+            self.new_game(self.board.size)
+            return "OK"
+        if command == "BEGIN":
+            return self.move()
+        if command == "TURN":
+            i, j = self.parse_move(argument)
+            self.board.play(i, j, app.opponent(self.color) if self.color else "noir")
+            return self.move()
+        if command == "BOARD":
+            self.position = {1: [], 2: []}
+            return None
+        if command == "TAKEBACK":
+            x, y = (int(value) for value in argument.split(",")[:2])
+            if not self.board.history or self.board.history[-1] != (y, x):
+                return "ERROR not the last move " + argument
+            self.board.undo()
+            return "OK"
+        return "UNKNOWN " + command
+
+    def board_line(self, line):
+        '''
+        One stone "x,y,field" of a BOARD command, or DONE
+        Errors are only answered at DONE, the manager waiting for no answer
+        before it
+        '''
+        line = line.strip()
+        if line.upper() != "DONE":
+            try:
+                x, y, field = (int(value) for value in line.split(","))
+            except ValueError:
+                field = None
+            if field in self.position:
+                self.position[field].append((y, x))
+            elif field != 3:
+                self.board_errors.append(line)
+            # Field 3 marks the stones of a continuous game, which belong to
+            # neither side
+            return None
+        errors, self.board_errors = self.board_errors, []
+        if errors:
+            self.position = None
+            return "ERROR invalid stone " + errors[0]
+        ours, theirs = self.position[1], self.position[2]
+        self.position = None
+        # Black has played as many stones as white, or one more, and it is
+        # our turn
+        color = "noir" if len(ours) == len(theirs) else "blanc"
+        first, second = (ours, theirs) if color == "noir" else (theirs, ours)
+        if len(first) - len(second) not in (0, 1):
+            return "ERROR {} stones against {}".format(len(ours), len(theirs))
+        board = app.make_board(self.board.size)
+        for k in range(len(first) + len(second)):
+            i, j = (first if k % 2 == 0 else second)[k // 2]
+            if not board.inside(i, j) or not board.is_empty(i, j):
+                return "ERROR invalid stone {},{}".format(j, i)
+            board.play(i, j, "noir" if k % 2 == 0 else "blanc")
+        self.board, self.color = board, color
+        return self.move()
+
+
+def main():
+    engine = ProtocolEngine()
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        try:
+            answer = engine.handle(line)
+        except SystemExit:
+            break
+        except (ValueError, KeyError) as error:
+            answer = "ERROR " + str(error)
+        if answer is not None:
+            print(answer, flush=True)
+    if engine.pool is not None:
+        engine.pool.close()
+    if engine.mcts is not None:
+        engine.mcts.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,418 @@
+'''
+Match server hosting many games at once against the engine of app.py
+
+    python server.py --port 5005 --workers 8
+    python server.py --unix /tmp/gomoku.sock
+
+Clients connect on localhost and send one JSON object per line, answered
+by one JSON line carrying the same "id" when the request has one:
+
+    {"op": "new", "size": 15, "color": "noir", "time": 1.0, "budget": 60}
+    {"op": "move", "game": 1, "move": "h8"}
+    {"op": "close", "game": 1}
+    {"op": "stats"}
+
+"color" is the colour of the engine, which answers "new" with its first
+move when it plays black, and every "move" of the client with its own.
+Moves use the compact notation of app.parse_moves. "time" bounds each
+search and "budget" the search time of the whole game. The searches run
+on a process pool of a fixed size and wait in a queue served round robin
+between the connections, so that a client with many games does not hold
+up the others. "stats" reports the games, the throughput and the time the
+searches waited in the queue. "close" ends the search of the game when it
+still waits in the queue, and is refused while it runs on the pool.
+'''
+import argparse
+import asyncio
+import collections
+import concurrent.futures
+import itertools
+import json
+import sys
+import time
+
+import app
+
+
+# Largest board a client can ask for
+MAX_SIZE = 26
+# Searches kept for the latency percentiles, and seconds of the throughput
+METRICS_WINDOW = 1000
+THROUGHPUT_SECONDS = 60
+
+# State of a pool worker process, kept from one search to the other
+_worker = {}
+
+
+def _init_worker():
+    _worker["tt"] = app.TranspositionTable()
+    _worker["book"] = app.OpeningBook()
+
+
+def engine_move(moves, size, color, time_limit):
+    '''
+    Move of color after moves, chosen in a worker process
+    Returns the move, the rule that chose it and the seconds spent
+    '''
+    board = app.position_board(moves, size)
+    start = time.perf_counter()
+    move, info = app.choose_move(board, color, _worker["tt"], book=_worker["book"],
+                                 time_limit=time_limit)
+    return tuple(move), info["branch"], time.perf_counter() - start
+
+
+def percentiles(values):
+    '''
+    Nearest-rank percentiles of a list of seconds
+    '''
+    if not values:
+        return None
+    return {"p{}".format(rate): app.percentile(values, rate) for rate in (50, 90, 99, 100)}
+
+
+def field(request, name, types, default=None):
+    '''
+    Value of a field of a request, None or one of types
+    '''
+    value = request.get(name, default)
+    if value is not None and (not isinstance(value, types) or isinstance(value, bool)):
+        raise ValueError("invalid {} {}".format(name, json.dumps(value)))
+    return value
+
+
+class Game:
+    '''
+    Board of a game and the budget left to the engine
+    '''
+
+    def __init__(self, number, client, size, color, move_time, budget):
+        self.number = number
+        self.client = client
+        self.board = app.make_board(size)
+        self.color = color
+        self.move_time = move_time
+        self.budget = budget
+        self.result = None
+        # Search of the engine move, while it waits for the pool or runs
+        self.search = None
+
+    @property
+    def searching(self):
+        return self.search is not None
+
+    def turn_time(self):
+        if self.budget is None:
+            return self.move_time
+        return min(self.move_time, app.time_per_move(self.board, self.budget))
+
+
+class Search:
+    '''
+    Engine move of a game waiting for the pool
+    '''
+
+    def __init__(self, game, loop):
+        self.game = game
+        self.time_limit = game.turn_time()
+        self.queued = time.monotonic()
+        self.running = False
+        self.future = loop.create_future()
+
+
+class FairQueue:
+    '''
+    Searches waiting for the pool, one client after the other
+    '''
+
+    def __init__(self):
+        # Client -> its searches in order, the next client served first
+        self.clients = collections.OrderedDict()
+        self.size = 0
+        self.waiting = asyncio.Event()
+
+    def put(self, client, search):
+        self.clients.setdefault(client, collections.deque()).append(search)
+        self.size += 1
+        self.waiting.set()
+
+    async def get(self):
+        while not self.clients:
+            self.waiting.clear()
+            await self.waiting.wait()
+        client, searches = self.clients.popitem(last=False)
+        search = searches.popleft()
+        if searches:
+            self.clients[client] = searches
+        self.size -= 1
+        return search
+
+    def remove(self, client, search):
+        '''
+        Take a waiting search out of the queue
+        '''
+        searches = self.clients.get(client)
+        if searches and search in searches:
+            searches.remove(search)
+            self.size -= 1
+            if not searches:
+                del self.clients[client]
+
+    def drop(self, client):
+        '''
+        Cancel the waiting searches of a client
+        '''
+        searches = self.clients.pop(client, ())
+        self.size -= len(searches)
+        for search in searches:
+            search.future.cancel()
+
+
+class Metrics:
+    '''
+    Throughput of the pool and latency of the last searches
+    '''
+
+    def __init__(self):
+        self.start = time.monotonic()
+        self.searches = 0
+        self.waits = collections.deque(maxlen=METRICS_WINDOW)
+        self.durations = collections.deque(maxlen=METRICS_WINDOW)
+        # End of the searches of the last THROUGHPUT_SECONDS
+        self.ends = collections.deque()
+
+    def searched(self, waited, seconds):
+        now = time.monotonic()
+        self.searches += 1
+        self.waits.append(waited)
+        self.durations.append(seconds)
+        self.ends.append(now)
+        while self.ends[0] < now - THROUGHPUT_SECONDS:
+            self.ends.popleft()
+
+    def report(self):
+        now = time.monotonic()
+        window = min(now - self.start, THROUGHPUT_SECONDS)
+        recent = sum(1 for end in self.ends if end >= now - THROUGHPUT_SECONDS)
+        return {"uptime": now - self.start, "searches": self.searches,
+                "searches_per_second": recent / window if window else 0.0,
+                "queue_latency": percentiles(self.waits),
+                "search_seconds": percentiles(self.durations)}
+
+
+class MatchServer:
+    '''
+    Games of all the connections and the pool searching their moves
+    '''
+
+    def __init__(self, workers, max_time):
+        self.workers = workers
+        self.max_time = max_time
+        self.executor = concurrent.futures.ProcessPoolExecutor(workers, initializer=_init_worker)
+        self.games = {}
+        self.numbers = itertools.count(1)
+        self.finished = 0
+        self.clients = itertools.count(1)
+        self.queue = FairQueue()
+        self.metrics = Metrics()
+
+    async def dispatch(self):
+        '''
+        Run the searches of the queue on the pool, one at a time
+        One dispatcher per worker keeps every process busy, while the order
+        of the searches is decided by the queue and not by the pool
+        '''
+        loop = asyncio.get_running_loop()
+        while True:
+            search = await self.queue.get()
+            if search.future.done():
+                continue
+            search.running = True
+            game = search.game
+            waited = time.monotonic() - search.queued
+            try:
+                move, branch, seconds = await loop.run_in_executor(
+                    self.executor, engine_move, [tuple(move) for move in game.board.history],
+                    game.board.size, game.color, search.time_limit)
+            except Exception as error:
+                if not search.future.done():
+                    search.future.set_exception(error)
+                continue
+            self.metrics.searched(waited, seconds)
+            if not search.future.done():
+                search.future.set_result((move, branch, seconds))
+
+    async def engine_turn(self, game):
+        '''
+        Queue the search of the engine move of game, play it and return
+        the answer to the client
+        '''
+        search = Search(game, asyncio.get_running_loop())
+        game.search = search
+        self.queue.put(game.client, search)
+        try:
+            move, branch, seconds = await search.future
+        finally:
+            game.search = None
+        if game.budget is not None:
+            game.budget = max(game.budget - seconds, 0.0)
+        game.board.play(move[0], move[1], game.color)
+        self.check_end(game)
+        return {"game": game.number, "move": app.move_notation(*move), "branch": branch,
+                "seconds": seconds, "result": game.result}
+
+    def check_end(self, game):
+        game.result = app.game_over(game.board)
+        if game.result is not None:
+            self.finished += 1
+
+    def stats(self):
+        return {"games": len(self.games), "finished": self.finished,
+                "searching": sum(game.searching for game in self.games.values()),
+                "queued": self.queue.size, "workers": self.workers, **self.metrics.report()}
+
+    def game(self, client, request):
+        game = self.games.get(field(request, "game", int))
+        if game is None or game.client != client:
+            raise ValueError("unknown game {}".format(request.get("game")))
+        return game
+
+    async def answer(self, client, request):
+        op = request.get("op")
+        if op == "new":
+            size = field(request, "size", int, 15)
+            color = field(request, "color", str, "blanc")
+            move_time = field(request, "time", (int, float), self.max_time)
+            budget = field(request, "budget", (int, float))
+            if not 5 <= size <= MAX_SIZE or color not in ("noir", "blanc") or move_time < 0:
+                raise ValueError("invalid game")
+            game = Game(next(self.numbers), client, size, color, min(move_time, self.max_time), budget)
+            self.games[game.number] = game
+            if color == "noir":
+                return await self.engine_turn(game)
+            return {"game": game.number}
+        if op == "move":
+            game = self.game(client, request)
+            if game.result is not None or game.searching:
+                raise ValueError("not your turn")
+            text = field(request, "move", str, "")
+            moves = app.parse_moves(text)
+            if len(moves) != 1:
+                raise ValueError("one move expected")
+            i, j = moves[0]
+            if not game.board.inside(i, j) or not game.board.is_empty(i, j):
+                raise ValueError("invalid move " + text)
+            game.board.play(i, j, app.opponent(game.color))
+            self.check_end(game)
+            if game.result is not None:
+                return {"game": game.number, "result": game.result}
+            try:
+                return await self.engine_turn(game)
+            except Exception:
+                # The client can send its move again
+                game.board.undo()
+                raise
+        if op == "close":
+            game = self.game(client, request)
+            search = game.search
+            if search is not None:
+                # A search on the pool cannot be stopped, one in the queue
+                # ends the request waiting for it
+                if search.running:
+                    raise ValueError("game {} is searching".format(game.number))
+                self.queue.remove(client, search)
+                search.future.set_exception(ValueError("game {} closed".format(game.number)))
+            del self.games[game.number]
+            return {"game": game.number, "closed": True}
+        if op == "stats":
+            return self.stats()
+        raise ValueError("unknown op {}".format(op))
+
+    async def reply(self, client, line, writer, lock):
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("a JSON object is expected")
+        except ValueError as error:
+            request, answer = {}, {"error": str(error)}
+        else:
+            try:
+                answer = await self.answer(client, request)
+            except ValueError as error:
+                answer = {"error": str(error)}
+            except Exception as error:
+                # A failure of the pool or of the engine ends this request only
+                answer = {"error": "{}: {}".format(type(error).__name__, error)}
+        if "id" in request:
+            answer["id"] = request["id"]
+        async with lock:
+            writer.write((json.dumps(answer) + "\n").encode())
+            await writer.drain()
+
+    async def handle(self, reader, writer):
+        '''
+        Requests of one connection, answered as their searches end
+        '''
+        client = next(self.clients)
+        lock = asyncio.Lock()
+        tasks = set()
+        try:
+            async for line in reader:
+                if not line.strip():
+                    continue
+                task = asyncio.create_task(self.reply(client, line, writer, lock))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            await asyncio.gather(*tasks, return_exceptions=True)
+        except ConnectionError:
+            pass
+        finally:
+            self.queue.drop(client)
+            for task in tasks:
+                task.cancel()
+            for number in [number for number, game in self.games.items() if game.client == client]:
+                del self.games[number]
+            writer.close()
+
+    async def report(self, period):
+        while True:
+            await asyncio.sleep(period)
+            print(json.dumps(self.stats()), file=sys.stderr, flush=True)
+
+    async def serve(self, host, port, unix, period):
+        if unix:
+            server = await asyncio.start_unix_server(self.handle, unix)
+        else:
+            server = await asyncio.start_server(self.handle, host, port)
+        tasks = [asyncio.create_task(self.dispatch()) for _ in range(self.workers)]
+        if period:
+            tasks.append(asyncio.create_task(self.report(period)))
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            for task in tasks:
+                task.cancel()
+            self.executor.shutdown(cancel_futures=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5005)
+    parser.add_argument("--unix", help="listen on this Unix socket instead of TCP")
+    parser.add_argument("--workers", type=int, default=app.SEARCH_WORKERS)
+    parser.add_argument("--max-time", type=float, default=app.MOVE_TIME_LIMIT,
+                        help="longest search of a move, whatever the client asks")
+    parser.add_argument("--report", type=float, default=None,
+                        help="seconds between two stats lines on stderr")
+    args = parser.parse_args()
+
+    server = MatchServer(args.workers, args.max_time)
+    try:
+        asyncio.run(server.serve(args.host, args.port, args.unix, args.report))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
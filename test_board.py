@@ -0,0 +1,147 @@
+'''
+State kept incrementally by the boards, checked against a recomputation
+from the stones after every move and every undo of random games
+'''
+import random
+
+import pytest
+
+import app
+
+
+def random_game(board, rng, plies):
+    '''
+    Play plies random moves close to the stones, black first
+    '''
+    color = "noir"
+    for _ in range(plies):
+        moves = board.candidate_moves()
+        i, j = rng.choice(moves) if moves else (7, 7)
+        board.play(i, j, color)
+        yield
+        color = app.opponent(color)
+
+
+def play_and_undo(board, seed, plies=40):
+    '''
+    Random game on board, then undo of all its moves, yielding after every
+    change of the board
+    '''
+    rng = random.Random(seed)
+    yield from random_game(board, rng, plies)
+    while board.history:
+        board.undo()
+        yield
+
+
+def stones(board, color):
+    return {(i, j) for i, j, stone in board.moves() if stone == color}
+
+
+def scratch_runs(board, color):
+    '''
+    Number of maximal runs of each length of color, counted from its stones
+    '''
+    own = stones(board, color)
+    runs = {}
+    for i, j in own:
+        for di, dj in app.DIRECTIONS:
+            if (i - di, j - dj) in own:
+                continue
+            length = 1
+            while (i + length * di, j + length * dj) in own:
+                length += 1
+            runs[length] = runs.get(length, 0) + 1
+    return runs
+
+
+def board_runs(board, color):
+    runs = board.runs[app.COLOR_CODES[color]]
+    lengths = runs.items() if isinstance(runs, dict) else enumerate(runs)
+    return {length: count for length, count in lengths if count}
+
+
+def scratch_evaluate(board, color):
+    length = max(scratch_runs(board, color), default=0)
+    return min(length, 6) if length >= 2 else 0
+
+
+def scratch_candidates(board):
+    '''
+    Empty squares of the board within FRONTIER_DISTANCE of a stone
+    '''
+    taken = {(i, j) for i, j, _ in board.moves()}
+    reach = range(-app.FRONTIER_DISTANCE, app.FRONTIER_DISTANCE + 1)
+    return sorted({(i + di, j + dj) for i, j in taken for di in reach for dj in reach
+                   if board.inside(i + di, j + dj) and (i + di, j + dj) not in taken})
+
+
+@pytest.mark.parametrize("seed", range(10))
+@pytest.mark.parametrize("size", [9, 15])
+def test_run_counts_follow_play_and_undo(size, seed):
+    board = app.Board(size)
+    for _ in play_and_undo(board, seed):
+        for color in ("noir", "blanc"):
+            assert board_runs(board, color) == scratch_runs(board, color)
+            assert app.evaluate(board, color) == scratch_evaluate(board, color)
+
+
+@pytest.mark.parametrize("seed", range(10))
+@pytest.mark.parametrize("size", [9, 15])
+def test_frontier_follows_play_and_undo(size, seed):
+    board = app.Board(size)
+    for _ in play_and_undo(board, seed):
+        assert [tuple(move) for move in board.candidate_moves()] == scratch_candidates(board)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_undo_brings_the_board_back_to_empty(seed):
+    board = app.Board(15)
+    for _ in play_and_undo(board, seed):
+        pass
+    assert board.hash == 0
+    assert board.bits == [0, 0, 0]
+    assert not any(board.cells)
+    assert all(not any(runs) for runs in board.runs)
+    assert board.frontier == 0
+    assert not any(board.near)
+
+
+@pytest.mark.parametrize("seed", range(10))
+@pytest.mark.parametrize("size", [9, 15, 40])
+def test_sparse_board_matches_board(size, seed):
+    dense, sparse = app.Board(size), app.SparseBoard(size)
+    for _ in play_and_undo(dense, seed):
+        # The same change on the sparse board
+        if len(dense.history) > len(sparse.history):
+            i, j = dense.history[-1]
+            sparse.play(i, j, dense[i, j])
+        else:
+            sparse.undo()
+        assert sparse.candidate_moves() == dense.candidate_moves()
+        for color in ("noir", "blanc"):
+            assert app.evaluate(sparse, color) == app.evaluate(dense, color)
+            assert app.find_patterns(sparse, color) == app.find_patterns(dense, color)
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_unbounded_board_follows_play_and_undo(seed):
+    board = app.SparseBoard()
+    for _ in play_and_undo(board, seed):
+        assert [tuple(move) for move in board.candidate_moves()] == scratch_candidates(board)
+        for color in ("noir", "blanc"):
+            assert board_runs(board, color) == scratch_runs(board, color)
+            assert app.evaluate(board, color) == scratch_evaluate(board, color)
+
+
+@pytest.mark.parametrize("size", [15, None])
+def test_undo_brings_the_sparse_board_back_to_empty(size):
+    board = app.SparseBoard(size)
+    for _ in play_and_undo(board, 0):
+        pass
+    assert board.hash == 0
+    assert board.cells == {}
+    assert board.lines == [None, {}, {}]
+    assert board_runs(board, "noir") == board_runs(board, "blanc") == {}
+    assert board.near == {}
+    assert board.frontier == set()
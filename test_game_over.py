@@ -0,0 +1,74 @@
+'''
+End of the game after a five in a row or on a full board, and the shortcut
+of minmax on a five
+'''
+import math
+
+import pytest
+
+import app
+
+
+BOARDS = [lambda: app.Board(15), lambda: app.SparseBoard(15), lambda: app.SparseBoard()]
+
+
+def five(start, direction):
+    return [(start[0] + k * direction[0], start[1] + k * direction[1]) for k in range(5)]
+
+
+# Fives along the four directions, in the middle and against the edges
+FIVES = [five(start, direction) for direction, starts in [
+    ((0, 1), [(7, 5), (0, 0), (14, 10)]),
+    ((1, 0), [(5, 7), (0, 14), (10, 0)]),
+    ((1, 1), [(5, 5), (0, 0), (10, 10)]),
+    ((1, -1), [(5, 9), (0, 14), (10, 4)]),
+] for start in starts]
+
+
+@pytest.mark.parametrize("make", BOARDS)
+@pytest.mark.parametrize("squares", FIVES)
+@pytest.mark.parametrize("last", [0, 2, 4])
+def test_five_ends_the_game(make, squares, last):
+    board = make()
+    squares = squares[:last] + squares[last + 1:] + [squares[last]]
+    for i, j in squares[:-1]:
+        board.play(i, j, "noir")
+        assert not app.last_move_wins(board)
+        assert app.game_over(board) is None
+    board.play(*squares[-1], "noir")
+    assert app.last_move_wins(board)
+    assert app.game_over(board) == "noir"
+
+
+def test_full_board_without_five_is_a_draw():
+    board = app.Board(5)
+    for i in range(5):
+        for j in range(5):
+            assert app.game_over(board) is None
+            board.play(i, j, "noir" if (2 * i + j) % 4 < 2 else "blanc")
+            assert not app.last_move_wins(board)
+    assert app.game_over(board) == "vide"
+
+
+def test_empty_board_goes_on():
+    assert not app.last_move_wins(app.Board(15))
+    assert app.game_over(app.SparseBoard()) is None
+
+
+@pytest.mark.parametrize("make", BOARDS)
+@pytest.mark.parametrize("maximizing, color, score", [
+    (True, "noir", app.WIN_SCORE),
+    (False, "blanc", -app.WIN_SCORE),
+])
+def test_minmax_stops_on_a_five(make, maximizing, color, score):
+    board = make()
+    for j in range(7, 11):
+        board.play(7, j, "noir")
+        board.play(0, 2 * j - 14, "blanc")
+    before = board.candidate_moves()
+    trace = app.SearchTrace()
+    assert app.minmax((7, 11), 3, -math.inf, math.inf, maximizing, color, board,
+                      trace=trace) == score
+    # The five is a leaf, and the board is left as it was
+    assert (trace.nodes, trace.leaves) == (1, 1)
+    assert board.candidate_moves() == before
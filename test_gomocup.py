@@ -0,0 +1,92 @@
+'''
+Sessions of the Gomocup protocol driven through ProtocolEngine.handle
+'''
+import pytest
+
+import app
+import gomocup
+
+
+@pytest.fixture
+def engine(monkeypatch):
+    # One process and no archive, the searches are short
+    monkeypatch.setattr(app, "SEARCH_WORKERS", 1)
+    monkeypatch.setattr(app, "PONDER", False)
+    monkeypatch.setattr(app, "ENGINE", "minmax")
+    engine = gomocup.ProtocolEngine()
+    engine.archive = None
+    return engine
+
+
+def square(answer):
+    x, y = (int(value) for value in answer.split(","))
+    return y, x
+
+
+def test_session(engine):
+    assert engine.handle("START 15") == "OK"
+    assert engine.handle("INFO timeout_turn 200") is None
+    i, j = square(engine.handle("BEGIN"))
+    assert engine.board[i, j] == "noir"
+    turn = "7,6" if (i, j) != (6, 7) else "8,6"
+    reply = square(engine.handle("TURN " + turn))
+    assert engine.board[square(turn)] == "blanc"
+    assert engine.board[reply] == "noir"
+    assert len(engine.board.history) == 3
+    assert engine.handle("TAKEBACK {},{}".format(reply[1], reply[0])) == "OK"
+    assert engine.board.is_empty(*reply)
+    assert engine.handle("TAKEBACK 0,0").startswith("ERROR")
+
+    # We play white after two black stones and one white one
+    for line in ["BOARD", "7,7,2", "8,8,1", "9,9,2"]:
+        assert engine.handle(line) is None
+    i, j = square(engine.handle("DONE"))
+    assert engine.board[i, j] == "blanc"
+    assert engine.board[7, 7] == engine.board[9, 9] == "noir"
+    assert len(engine.board.history) == 4
+    with pytest.raises(SystemExit):
+        engine.handle("END")
+
+
+def test_board_ignores_the_stones_of_a_continuous_game(engine):
+    engine.handle("START 15")
+    engine.handle("INFO timeout_turn 200")
+    for line in ["BOARD", "7,7,1", "0,0,3", "8,8,2", "1,1,3"]:
+        assert engine.handle(line) is None
+    square(engine.handle("DONE"))
+    assert engine.board.is_empty(0, 0) and engine.board.is_empty(1, 1)
+    assert len(engine.board.history) == 3
+
+
+@pytest.mark.parametrize("bad", ["7,7,4", "7,7", "a,b,1", "7,7,1,2"])
+def test_board_answers_its_errors_at_done(engine, bad):
+    engine.handle("START 15")
+    engine.handle("INFO timeout_turn 200")
+    for line in ["BOARD", "7,7,1", bad, "8,8,2"]:
+        assert engine.handle(line) is None
+    assert engine.handle("DONE").startswith("ERROR")
+    # The next BOARD command starts again from its own stones
+    for line in ["BOARD", "7,7,2"]:
+        assert engine.handle(line) is None
+    square(engine.handle("DONE"))
+    assert len(engine.board.history) == 2
+
+
+def test_turn_time_shares_the_match_time(engine):
+    engine.handle("START 15")
+    assert engine.turn_time() == app.MOVE_TIME_LIMIT
+    engine.handle("INFO time_left 112000")
+    # 112 moves left to each side on the empty board
+    assert engine.turn_time() == pytest.approx(1.0 * (1 - gomocup.TIME_MARGIN))
+    engine.handle("INFO timeout_turn 500")
+    assert engine.turn_time() == pytest.approx(0.5 * (1 - gomocup.TIME_MARGIN))
+    engine.handle("INFO time_left 1120")
+    assert engine.turn_time() == pytest.approx(0.01 * (1 - gomocup.TIME_MARGIN))
+
+
+def test_time_per_move_keeps_a_share_for_the_end_of_the_game():
+    board = app.Board(5)
+    for k in range(20):
+        board.play(*divmod(k, 5), "noir" if k % 2 == 0 else "blanc")
+    # 2 moves left to each side, but the time is shared as if 10 were left
+    assert app.time_per_move(board, 1.0) == pytest.approx(1.0 / app.MIN_MOVES_LEFT)
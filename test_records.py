@@ -0,0 +1,85 @@
+'''
+Compact notation of the moves, read back by parse_moves, and games written
+to a GameArchive then read back
+'''
+import os
+import random
+
+import pytest
+
+import app
+
+
+@pytest.mark.parametrize("size", [5, 15, 26, 27, 60, 255])
+def test_notation_round_trips_on_every_square_of_the_edges(size):
+    squares = [(i, j) for i in (0, size // 2, size - 1) for j in range(size)]
+    text = " ".join(app.move_notation(i, j) for i, j in squares)
+    assert app.parse_moves(text) == squares
+    assert app.parse_moves(text.replace(" ", "")) == squares
+
+
+def test_notation_of_known_squares():
+    assert app.move_notation(7, 7) == "h8"
+    assert app.move_notation(0, 25) == "z1"
+    assert app.move_notation(3, 26) == "aa4"
+
+
+@pytest.mark.parametrize("square", [(0, -1), (0, -2), (-1, 0), (-5, -5)])
+def test_notation_refuses_negative_squares(square):
+    with pytest.raises(ValueError):
+        app.move_notation(*square)
+
+
+@pytest.mark.parametrize("text", ["h8 !", "8h", "h8 i"])
+def test_parse_moves_refuses_other_text(text):
+    with pytest.raises(ValueError):
+        app.parse_moves(text)
+
+
+def archived_game(size, seed, winner):
+    '''
+    Board of a random game on size, ending on the last square of the board
+    '''
+    rng = random.Random(seed)
+    squares = rng.sample([(i, j) for i in range(size) for j in range(size - 1)], 2 * size)
+    board = app.Board(size)
+    color = "noir"
+    for i, j in squares + [(size - 1, size - 1)]:
+        board.play(i, j, color)
+        color = app.opponent(color)
+    return board, winner
+
+
+@pytest.fixture
+def games():
+    return [archived_game(size, seed, winner) for seed, (size, winner) in enumerate(
+        [(15, "noir"), (16, "blanc"), (17, None), (19, "noir"), (16, None)])]
+
+
+def test_archive_reads_back_its_games(tmp_path, games):
+    archive = app.GameArchive(str(tmp_path / "games.bin"))
+    for board, winner in games:
+        archive.append(board, winner)
+    records = list(archive)
+    assert records == [app.GameRecord(board.size, winner, [tuple(move) for move in board.history])
+                       for board, winner in games]
+    for record, (board, _) in zip(records, games):
+        replayed = [(i, j, color) for (_, color), (i, j) in zip(app.replay(record), record.moves)]
+        assert replayed == [(i, j, board[i, j]) for i, j in board.history]
+
+
+@pytest.mark.parametrize("cut", [1, 2, 3, 4, 5, 30])
+def test_archive_skips_a_truncated_last_game(tmp_path, games, cut):
+    path = str(tmp_path / "games.bin")
+    archive = app.GameArchive(path)
+    for board, winner in games:
+        archive.append(board, winner)
+    os.truncate(path, os.path.getsize(path) - cut)
+    assert [record.size for record in archive] == [board.size for board, _ in games[:-1]]
+
+
+def test_archive_refuses_unbounded_boards(tmp_path):
+    board = app.SparseBoard()
+    board.play(0, 0, "noir")
+    with pytest.raises(ValueError):
+        app.GameArchive(str(tmp_path / "games.bin")).append(board)
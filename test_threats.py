@@ -0,0 +1,107 @@
+'''
+Threat ranking of find_threats and threat_rule on small lines, against the
+squares the first version of the engine chose: next to the line of pawns
+Forced wins of threat_space_search and the defence against them
+'''
+import pytest
+
+import app
+
+
+def board(text, size):
+    return app.position_board(app.parse_moves(text), size)
+
+
+@pytest.mark.parametrize("size", [15, None])
+@pytest.mark.parametrize("text, color, squares, branch", [
+    # Vertical pair of black, white blocks one of its ends
+    ("h8 i9 h9", "blanc", {(6, 7), (9, 7)}, "On neutralise la menace"),
+    # Horizontal pair of black, black lengthens it
+    ("h8 a1 i8 a15", "noir", {(7, 6), (7, 9)}, "On attaque"),
+    # Diagonal pair of black, black lengthens it
+    ("h8 a1 i9 a15", "noir", {(6, 6), (9, 9)}, "On attaque"),
+    # Horizontal three of black, white blocks one of its ends
+    ("h8 a1 i8 a15 j8", "blanc", {(7, 6), (7, 10)}, "On neutralise la menace"),
+    # Vertical three of black, white blocks one of its ends
+    ("h8 i9 h9 i10 h10", "blanc", {(6, 7), (10, 7)}, "On neutralise la menace"),
+])
+def test_threat_rule_plays_next_to_the_line(text, color, squares, branch, size):
+    position, rule, _ = app.threat_rule(board(text, size), color)
+    assert tuple(position) in squares
+    assert rule == branch
+
+
+@pytest.mark.parametrize("size", [15, None])
+def test_equal_threats_rank_the_ends_of_the_line_first(size):
+    threats = app.find_threats(board("h8 a1 i8 a15 j8", size), "noir")
+    assert {threat[:2] for threat in threats[:2]} == {(7, 6), (7, 10)}
+    assert all(threat[2] == 4 for threat in threats[:2])
+
+
+def stones(black, white, size):
+    '''
+    Board where black and white played their squares in turn, black first
+    '''
+    moves = [None] * (len(black) + len(white))
+    moves[::2], moves[1::2] = black, white
+    return app.position_board(moves, size)
+
+
+# White stones far from the lines of the tests
+CORNERS = [(0, 0), (0, 14), (14, 0), (14, 14), (0, 7)]
+
+
+@pytest.mark.parametrize("size", [15, None])
+def test_open_three_wins_by_its_open_four(size):
+    p = stones([(7, 7), (7, 8), (7, 9)], CORNERS[:3], size)
+    assert app.threat_space_search(p, "noir", threes=False) in {(7, 6), (7, 10)}
+
+
+@pytest.mark.parametrize("size", [15, None])
+def test_vcf_chain_of_two_fours(size):
+    # A closed three in row 7 and one in row 10, the four of one of them
+    # makes the second four of column 10 once white has blocked it
+    black = [(7, 7), (7, 8), (7, 9), (8, 10), (9, 10), (10, 7), (10, 8), (10, 9)]
+    white = [(7, 6), (11, 10), (10, 6)] + CORNERS
+    p = stones(black, white, size)
+    assert app.threat_space_search(p, "noir", threes=False, max_depth=1) is None
+    win = app.threat_space_search(p, "noir", threes=False)
+    assert win in {(7, 10), (10, 10)}
+    p.play(*win, "noir")
+    # A single four: the win needs the second one
+    assert len(app._five_squares(app.find_patterns(p, "noir", (5,)))) == 1
+
+
+@pytest.mark.parametrize("size", [15, None])
+def test_block_of_a_four_wins_when_it_makes_a_four(size):
+    # The white four of column 10 is blocked on the square that makes the
+    # black three of row 7 an open four
+    p = stones([(7, 7), (7, 8), (7, 9), (2, 10)], [(3, 10), (4, 10), (5, 10), (6, 10)], size)
+    assert app.threat_space_search(p, "noir") == (7, 10)
+
+
+@pytest.mark.parametrize("size", [15, None])
+def test_open_three_does_not_win_against_a_four(size):
+    # Black has to block the white four of column 0 and loses its tempo
+    p = stones([(7, 7), (7, 8), (7, 9), (2, 0)], [(3, 0), (4, 0), (5, 0), (6, 0)], size)
+    assert app.threat_space_search(p, "noir") is None
+
+
+@pytest.mark.parametrize("size", [15, None])
+@pytest.mark.parametrize("black", [
+    [(7, 7), (7, 8), (7, 9)],
+    [(7, 7), (7, 8), (7, 10)],
+])
+def test_three_blocked_on_one_side_does_not_win(black, size):
+    p = stones(black, [(7, 6)] + CORNERS[:2], size)
+    assert app.threat_space_search(p, "noir") is None
+
+
+@pytest.mark.parametrize("size", [15, None])
+def test_defence_stops_the_open_three(size):
+    p = stones([(7, 7), (7, 8), (7, 9)], CORNERS[:2], size)
+    win = app.threat_space_search(p, "noir")
+    assert win is not None
+    square = app.defend_threat_space(p, "blanc", win)
+    p.play(*square, "blanc")
+    assert app.threat_space_search(p, "noir") is None